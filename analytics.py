@@ -0,0 +1,92 @@
+import numpy as np
+
+from database import DatabaseConnection
+
+PERIOD_QUERY = """
+    SELECT a.date, TIME_TO_SEC(a.time_s) AS start_seconds, a.dent_id, a.num_cab,
+           COALESCE(d.special, 0) AS special, a.snils, a.sum
+    FROM appointment a
+    JOIN dentists d ON a.dent_id = d.dent_id
+    WHERE a.date BETWEEN %s AND %s
+"""
+RETURNING_QUERY = """
+    SELECT DISTINCT a.snils
+    FROM appointment a
+    WHERE a.date BETWEEN %s AND %s
+      AND EXISTS (SELECT 1 FROM appointment e WHERE e.snils = a.snils AND e.date < %s)
+"""
+
+
+class PeriodData:
+    def __init__(self, columns, returning_patients):
+        self.dates = np.array(columns['date'], dtype='datetime64[D]')
+        self.start_seconds = np.array(columns['start_seconds'], dtype=np.int64)
+        self.doctors = np.array(columns['dent_id'], dtype=np.int64)
+        self.cabinets = np.array(columns['num_cab'], dtype=np.int64)
+        self.specialties = np.array(columns['special'], dtype=np.int64)
+        self.patients = np.array(columns['snils'], dtype=str)
+        self.sums = np.array(columns['sum'], dtype=np.float64)
+        self.returning = np.isin(self.patients, np.array(sorted(returning_patients), dtype=str))
+
+    def __len__(self):
+        return len(self.sums)
+
+
+def load_period(start_date, end_date, db=None):
+    db = db or DatabaseConnection()
+    columns = db.fetch_columns(PERIOD_QUERY, (start_date, end_date))
+    returning = db.fetch_columns(RETURNING_QUERY, (start_date, end_date, start_date))['snils']
+    return PeriodData(columns, returning)
+
+
+def grouped_revenue(keys, sums):
+    if not len(keys):
+        return []
+    values, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(values))
+    totals = np.bincount(inverse, weights=sums, minlength=len(values))
+    order = np.argsort(-totals, kind='stable')
+    return [(values[i].item(), int(counts[i]), float(totals[i])) for i in order]
+
+
+def revenue_by_doctor(period):
+    return grouped_revenue(period.doctors, period.sums)
+
+
+def revenue_by_specialty(period):
+    return grouped_revenue(period.specialties, period.sums)
+
+
+def revenue_by_cabinet(period):
+    return grouped_revenue(period.cabinets, period.sums)
+
+
+def revenue_by_weekday_hour(period):
+    weekdays = (period.dates.astype(np.int64) + 3) % 7
+    hours = np.clip(period.start_seconds // 3600, 0, 23)
+    cells = weekdays * 24 + hours
+    counts = np.bincount(cells, minlength=7 * 24).reshape(7, 24)
+    totals = np.bincount(cells, weights=period.sums, minlength=7 * 24).reshape(7, 24)
+    return counts, totals
+
+
+def average_ticket(period):
+    if not len(period):
+        return {'count': 0, 'total': 0.0, 'mean': 0.0, 'median': 0.0}
+    return {
+        'count': len(period),
+        'total': float(period.sums.sum()),
+        'mean': float(period.sums.mean()),
+        'median': float(np.median(period.sums))
+    }
+
+
+def patient_mix(period):
+    mix = {}
+    for name, mask in (('new', ~period.returning), ('returning', period.returning)):
+        mix[name] = {
+            'patients': int(len(np.unique(period.patients[mask]))),
+            'visits': int(mask.sum()),
+            'revenue': float(period.sums[mask].sum())
+        }
+    return mix
@@ -0,0 +1,283 @@
+import argparse
+import json
+import math
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+from cache import ReferenceCache
+from database import DB_CONFIG, DatabaseConnection, configure_pool, insert_rows
+from migrations import migrate
+from repository import AppointmentRepository, PatientRepository, ReportRepository, rebuild_daily_revenue
+
+SCALES = {
+    'small': {'doctors': 10, 'services': 50, 'patients': 5000, 'appointments': 50000},
+    'medium': {'doctors': 30, 'services': 200, 'patients': 50000, 'appointments': 500000},
+    'large': {'doctors': 50, 'services': 500, 'patients': 200000, 'appointments': 5000000}
+}
+SPECIALTIES = ['Терапевт', 'Хирург', 'Ортодонт', 'Ортопед', 'Пародонтолог', 'Детский стоматолог', 'Гигиенист']
+SURNAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов', 'Михайлов',
+            'Новиков', 'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов', 'Егоров', 'Павлов']
+NAMES = ['Александр', 'Дмитрий', 'Максим', 'Сергей', 'Андрей', 'Алексей', 'Артём', 'Илья', 'Кирилл', 'Михаил']
+PATRONYMICS = ['Александрович', 'Дмитриевич', 'Сергеевич', 'Андреевич', 'Алексеевич', 'Иванович', 'Петрович']
+SERVICE_NAMES = ['Консультация', 'Чистка', 'Пломба', 'Удаление', 'Коронка', 'Рентген', 'Отбеливание', 'Имплант']
+SERVICE_TABLE_DATA = ['services', 'service_doctors', 'doctors']
+BATCH_SIZE = 2000
+APPOINTMENTS_PER_DAY = 12
+PATHS = ['load_patients', 'search_patients', 'update_appointments_table', 'on_doctor_changed', 'calculate_total_sum',
+         'load_services', 'find_slots', 'generate_report']
+
+
+def batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_rows(db, table, columns, rows):
+    count = 0
+    for batch in batches(rows):
+        with db.transaction() as cursor:
+            insert_rows(cursor, table, columns, batch)
+        count += len(batch)
+    return count
+
+
+def format_snils(number):
+    digits = f"{number:011d}"
+    return f"{digits[:3]}-{digits[3:6]}-{digits[6:9]} {digits[9:]}"
+
+
+def seed(db, doctors, services, patients, appointments, rng):
+    for number, description in migrate(db):
+        print(f"Применена миграция {number}: {description}", file=sys.stderr)
+    if db.fetchone("SELECT COUNT(*) AS count FROM appointment")['count']:
+        raise SystemExit('Таблица appointment не пуста: заполняйте отдельную пустую базу данных')
+    write_rows(db, 'special', ('name_sp',), [(name,) for name in SPECIALTIES])
+    specialty_ids = [row['id_special'] for row in db.fetchall("SELECT id_special FROM special")]
+    write_rows(db, 'dentists', ('surname_d', 'name_d', 'patron_d', 'special', 'exper', 'num_cab'),
+               ((rng.choice(SURNAMES), rng.choice(NAMES), rng.choice(PATRONYMICS), rng.choice(specialty_ids),
+                 rng.randint(0, 40), index + 100) for index in range(doctors)))
+    doctor_rows = db.fetchall("SELECT dent_id, num_cab FROM dentists")
+    write_rows(db, 'services', ('name_serv', 'price', 'exec_time'),
+               ((f"{rng.choice(SERVICE_NAMES)} №{index + 1}", rng.randint(5, 300) * 100, rng.choice([15, 30, 45, 60]))
+                for index in range(services)))
+    service_rows = db.fetchall("SELECT serv_id, price, exec_time FROM services")
+    links = {(service['serv_id'], doctor['dent_id']) for service in service_rows
+             for doctor in rng.sample(doctor_rows, min(len(doctor_rows), rng.randint(1, 5)))}
+    write_rows(db, 'service_doctors', ('serv_id', 'dent_id'), sorted(links))
+    services_by_doctor = {}
+    for serv_id, dent_id in links:
+        services_by_doctor.setdefault(dent_id, []).append(serv_id)
+    write_rows(db, 'patients', ('snils_id', 'surname_p', 'name_p', 'patron_p', 'birthday', 'phone', 'gender'),
+               ((format_snils(index + 1), rng.choice(SURNAMES), rng.choice(NAMES), rng.choice(PATRONYMICS),
+                 date(1940, 1, 1) + timedelta(days=rng.randint(0, 30000)),
+                 f"+7 (9{rng.randint(0, 99):02d}) {rng.randint(0, 999):03d}-{rng.randint(0, 99):02d}-"
+                 f"{rng.randint(0, 99):02d}", rng.choice(['М', 'Ж'])) for index in range(patients)))
+    prices = {service['serv_id']: (service['price'], service['exec_time']) for service in service_rows}
+    first_id = (db.fetchone("SELECT COALESCE(MAX(appoint_id), 0) AS last FROM appointment")['last'] or 0) + 1
+    days = -(-appointments // (len(doctor_rows) * APPOINTMENTS_PER_DAY))
+    first_day = date.today() - timedelta(days=days // 2)
+    app_serv = []
+
+    def appointment_rows():
+        appoint_id = first_id
+        for offset in range(days):
+            day = first_day + timedelta(days=offset)
+            for doctor in doctor_rows:
+                available = services_by_doctor.get(doctor['dent_id'])
+                start = 8 * 60
+                for _ in range(APPOINTMENTS_PER_DAY):
+                    if not available or appoint_id - first_id >= appointments:
+                        break
+                    chosen = rng.sample(available, min(len(available), rng.randint(1, 3)))
+                    end = start + sum(prices[serv_id][1] for serv_id in chosen)
+                    if end > 20 * 60:
+                        break
+                    app_serv.extend((appoint_id, serv_id, prices[serv_id][0]) for serv_id in chosen)
+                    yield (appoint_id, doctor['dent_id'], format_snils(rng.randint(1, patients)),
+                           f"{start // 60:02d}:{start % 60:02d}", f"{end // 60:02d}:{end % 60:02d}",
+                           doctor['num_cab'], day, sum(prices[serv_id][0] for serv_id in chosen))
+                    appoint_id += 1
+                    start = end
+
+    count = 0
+    for batch in batches(appointment_rows()):
+        with db.transaction() as cursor:
+            insert_rows(cursor, 'appointment',
+                        ('appoint_id', 'dent_id', 'snils', 'time_s', 'time_e', 'num_cab', 'date', 'sum'), batch)
+            insert_rows(cursor, 'app_serv', ('Appoint_id', 'Serv_id', 'price'), app_serv)
+        app_serv.clear()
+        count += len(batch)
+    with db.transaction() as cursor:
+        rebuild_daily_revenue(cursor)
+    return count
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples):
+    return {
+        'n': len(samples),
+        'min': min(samples),
+        'mean': statistics.mean(samples),
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'max': max(samples)
+    }
+
+
+class Benchmark:
+    def __init__(self, db, rng):
+        self.db = db
+        self.rng = rng
+        self.appointments = AppointmentRepository(db)
+        self.patients = PatientRepository(db)
+        self.reports = ReportRepository(db)
+        bounds = db.fetchone("SELECT MIN(date) AS first, MAX(date) AS last FROM appointment")
+        self.first_day = bounds['first'] or date.today()
+        self.days = max(1, ((bounds['last'] or self.first_day) - self.first_day).days + 1)
+        self.doctor_ids = [row['dent_id'] for row in db.fetchall("SELECT dent_id FROM dentists")]
+        self.service_ids = [row['serv_id'] for row in db.fetchall("SELECT serv_id FROM services")]
+        self.page_cursors = db.fetchall("SELECT snils_id, surname_p, name_p, phone FROM patients ORDER BY RAND() LIMIT 100")
+
+    def random_day(self):
+        return self.first_day + timedelta(days=self.rng.randrange(self.days))
+
+    def random_future_day(self, window=7):
+        first = max(self.first_day, date.today())
+        last = self.first_day + timedelta(days=self.days - 1)
+        return first + timedelta(days=self.rng.randrange(max(1, (last - first).days - window + 2)))
+
+    def random_services(self):
+        return self.rng.sample(self.service_ids, min(len(self.service_ids), self.rng.randint(1, 5)))
+
+    def load_patients(self):
+        last_patient = self.rng.choice(self.page_cursors) if self.page_cursors else None
+        return self.patients.page(None), self.patients.page(last_patient)
+
+    def search_patients(self):
+        if not self.page_cursors:
+            return []
+        patient = self.rng.choice(self.page_cursors)
+        text = self.rng.choice([patient['surname_p'][:3], patient['snils_id'][:5], patient['phone'][4:7]])
+        return self.patients.search(text)
+
+    def update_appointments_table(self):
+        return self.appointments.for_day(self.random_day().isoformat())
+
+    def on_doctor_changed(self):
+        day = self.random_day().replace(day=1)
+        month_end = (day + timedelta(days=32)).replace(day=1)
+        return self.appointments.doctor_schedule(self.rng.choice(self.doctor_ids), day.isoformat(),
+                                                 month_end.isoformat())
+
+    def calculate_total_sum(self):
+        with self.db.cursor() as cursor:
+            return sum(self.appointments._service_prices(cursor, self.random_services()).values())
+
+    def load_services(self):
+        return ReferenceCache().get_many(SERVICE_TABLE_DATA)
+
+    def find_slots(self):
+        start_date = self.random_future_day().isoformat()
+        return self.appointments.find_slots(self.random_services()[:1], None, start_date, 7, 10)
+
+    def generate_report(self):
+        end = self.random_day()
+        return self.reports.service_revenue((end - timedelta(days=30)).isoformat(), end.isoformat())
+
+    def run(self, paths, iterations, warmup):
+        results = {}
+        for path in paths:
+            operation = getattr(self, path)
+            for _ in range(warmup):
+                operation()
+            samples = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                operation()
+                samples.append((time.perf_counter() - started) * 1000)
+            results[path] = summarize(samples)
+            print(f"{path:28} p50 {results[path]['p50']:9.2f} ms  p95 {results[path]['p95']:9.2f} ms  "
+                  f"p99 {results[path]['p99']:9.2f} ms", file=sys.stderr)
+        return results
+
+
+def table_counts(db):
+    tables = ['dentists', 'services', 'service_doctors', 'patients', 'appointment', 'app_serv']
+    return {table: db.fetchone(f"SELECT COUNT(*) AS count FROM {table}")['count'] for table in tables}
+
+
+def compare(baseline, current, metric):
+    print(f"{'path':28} {'было, мс':>12} {'стало, мс':>12} {'изменение':>10}")
+    for path, result in current['results'].items():
+        if path not in baseline['results']:
+            continue
+        before, after = baseline['results'][path][metric], result[metric]
+        print(f"{path:28} {before:12.2f} {after:12.2f} {(after / before - 1) * 100 if before else 0:+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генерация тестовых данных и замеры основных запросов')
+    parser.add_argument('--database', default=DB_CONFIG['database'] + '_bench')
+    parser.add_argument('--seed', type=int, default=42)
+    commands = parser.add_subparsers(dest='command', required=True)
+    seed_parser = commands.add_parser('seed', help='заполнить пустую базу синтетическими данными')
+    seed_parser.add_argument('--scale', choices=SCALES, default='small')
+    for name in SCALES['small']:
+        seed_parser.add_argument(f'--{name}', type=int)
+    run_parser = commands.add_parser('run', help='замерить время запросов')
+    run_parser.add_argument('--iterations', type=int, default=50)
+    run_parser.add_argument('--warmup', type=int, default=3)
+    run_parser.add_argument('--paths', nargs='+', choices=PATHS, default=PATHS)
+    run_parser.add_argument('--label', default='')
+    run_parser.add_argument('--output')
+    compare_parser = commands.add_parser('compare', help='сравнить два файла результатов')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--metric', choices=['p50', 'p95', 'p99', 'mean'], default='p95')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.baseline, encoding='utf-8') as baseline, open(args.current, encoding='utf-8') as current:
+            compare(json.load(baseline), json.load(current), args.metric)
+        return
+    db = DatabaseConnection(configure_pool(database=args.database))
+    rng = random.Random(args.seed)
+    if args.command == 'seed':
+        scale = dict(SCALES[args.scale], **{name: getattr(args, name) for name in SCALES['small']
+                                            if getattr(args, name) is not None})
+        started = time.perf_counter()
+        count = seed(db, rng=rng, **scale)
+        print(f"Создано записей на прием: {count} за {time.perf_counter() - started:.1f} с", file=sys.stderr)
+        return
+    results = {
+        'label': args.label,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'database': args.database,
+        'seed': args.seed,
+        'iterations': args.iterations,
+        'counts': table_counts(db),
+        'results': Benchmark(db, rng).run(args.paths, args.iterations, args.warmup)
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+    else:
+        json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+
+from database import DatabaseConnection
+
+REFERENCE_QUERIES = {
+    'specialties': """
+        SELECT id_special, name_sp
+        FROM special
+        ORDER BY name_sp
+    """,
+    'doctors': """
+        SELECT d.*, s.name_sp as specialty_name
+        FROM dentists d
+        LEFT JOIN special s ON d.special = s.id_special
+        ORDER BY d.surname_d, d.name_d
+    """,
+    'services': """
+        SELECT serv_id, name_serv, price, exec_time
+        FROM services
+        ORDER BY name_serv
+    """,
+    'service_doctors': """
+        SELECT serv_id, dent_id
+        FROM service_doctors
+    """
+}
+
+
+class ReferenceCache:
+    def __init__(self, queries=REFERENCE_QUERIES):
+        self.queries = queries
+        self._data = {}
+        self._versions = dict.fromkeys(queries, 0)
+        self._lock = threading.Lock()
+
+    def peek(self, name):
+        with self._lock:
+            return self._data.get(name)
+
+    def get(self, name):
+        with self._lock:
+            if name in self._data:
+                return self._data[name]
+            version = self._versions[name]
+        rows = DatabaseConnection().fetchall(self.queries[name])
+        with self._lock:
+            if self._versions[name] == version:
+                self._data[name] = rows
+        return rows
+
+    def get_many(self, names):
+        return [self.get(name) for name in names]
+
+    def load(self, tasks, names, on_result, **kwargs):
+        cached = [self.peek(name) for name in names]
+        if all(rows is not None for rows in cached):
+            on_result(cached)
+        else:
+            tasks.run(self.get_many, names, on_result=on_result, **kwargs)
+
+    def versions(self, names):
+        with self._lock:
+            return tuple(self._versions[name] for name in names)
+
+    def invalidate(self, *names):
+        with self._lock:
+            for name in names:
+                self._data.pop(name, None)
+                self._versions[name] += 1
+
+
+reference_cache = ReferenceCache()
+
+
+class LRUCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._items if predicate(key)]:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
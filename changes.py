@@ -0,0 +1,63 @@
+import uuid
+
+from database import DatabaseConnection, insert_rows
+
+CLIENT_ID = uuid.uuid4().hex
+CHANGE_POLL_INTERVAL = 2
+CHANGE_BATCH_SIZE = 1000
+CHANGE_LOOKBACK = 200
+CHANGE_RETENTION_DAYS = 2
+CHANGE_PRUNE_INTERVAL = 3600
+REFERENCE_ENTITIES = {
+    'doctors': ('doctors', 'service_doctors'),
+    'services': ('services', 'service_doctors'),
+    'specialties': ('specialties', 'doctors')
+}
+CHANGES_QUERY = """
+    SELECT change_id, entity, entity_id, day, dent_id, origin
+    FROM change_log
+    WHERE change_id > %s
+    ORDER BY change_id
+    LIMIT %s
+"""
+
+
+def record_changes(cursor, entity, entity_id=None, doctor_days=()):
+    entity_id = None if entity_id is None else str(entity_id)
+    targets = sorted({(dent_id, str(day)) for dent_id, day in doctor_days}) or [(None, None)]
+    rows = [(entity, entity_id, day, dent_id, CLIENT_ID) for dent_id, day in targets]
+    insert_rows(cursor, 'change_log', ('entity', 'entity_id', 'day', 'dent_id', 'origin'), rows)
+
+
+def latest_change_id(db=None):
+    db = db or DatabaseConnection()
+    return db.fetchone("SELECT COALESCE(MAX(change_id), 0) AS change_id FROM change_log")['change_id']
+
+
+def fetch_changes(db, after_id, limit=CHANGE_BATCH_SIZE):
+    return db.fetchall(CHANGES_QUERY, (after_id, limit))
+
+
+def prune_changes(db=None, days=CHANGE_RETENTION_DAYS):
+    db = db or DatabaseConnection()
+    db.execute("DELETE FROM change_log WHERE created_at < NOW() - INTERVAL %s DAY", (days,))
+
+
+class ChangeSet:
+    def __init__(self, rows, local=False):
+        self.local = local
+        self.entities = set()
+        self.days = set()
+        self.doctor_days = set()
+        for row in rows:
+            self.entities.add(row['entity'])
+            if row['day'] is not None:
+                day = str(row['day'])
+                self.days.add(day)
+                self.doctor_days.add((row['dent_id'], day))
+
+    def affects_all_days(self):
+        return 'schedule' in self.entities
+
+    def references(self):
+        return {name for entity in self.entities for name in REFERENCE_ENTITIES.get(entity, ())}
@@ -0,0 +1,617 @@
+import bisect
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import mysql.connector
+
+DB_CONFIG = {
+    'host': '127.0.0.1',
+    'user': 'admin',
+    'password': 'admin',
+    'database': 'stomat',
+    'autocommit': True
+}
+POOL_SIZE = 8
+CHECKOUT_TIMEOUT = 10
+HEALTH_CHECK_INTERVAL = 30
+LOCK_WAIT_TIMEOUT = 3
+LOCK_WAIT_THRESHOLD = 0.02
+TRANSACTION_RETRIES = 5
+RETRY_BACKOFF = 0.02
+ER_LOCK_WAIT_TIMEOUT = 1205
+ER_LOCK_DEADLOCK = 1213
+SLOW_QUERY_MS = float(os.environ.get('STOMAT_SLOW_QUERY_MS', 200))
+SLOW_QUERY_LOG = os.environ.get('STOMAT_SLOW_QUERY_LOG')
+SLOW_QUERY_HISTORY = 100
+KILL_QUERY_DELAY = float(os.environ.get('STOMAT_KILL_QUERY_MS', 300)) / 1000
+QUERY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+WHITESPACE = re.compile(r'\s+')
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+VALUE_GROUPS = re.compile(r'(\([^()]*%s[^()]*\))(?:, \([^()]*%s[^()]*\))+')
+
+
+class PoolExhaustedError(Exception):
+    pass
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class PooledConnection:
+    def __init__(self, pool, connection):
+        self.pool = pool
+        self.connection = connection
+        self.connection_id = connection.connection_id
+        self.last_used = time.monotonic()
+
+    def is_stale(self):
+        return time.monotonic() - self.last_used > HEALTH_CHECK_INTERVAL
+
+
+class ConnectionPool:
+    def __init__(self, size=POOL_SIZE, timeout=CHECKOUT_TIMEOUT, **config):
+        self.size = size
+        self.timeout = timeout
+        self.config = dict(DB_CONFIG, **config)
+        self._idle = deque()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._closed = False
+        self._stats = {'checkouts': 0, 'waits': 0, 'timeouts': 0, 'health_checks': 0,
+                       'reconnects': 0, 'discarded': 0, 'max_in_use': 0, 'killed_queries': 0}
+
+    def _connect(self):
+        return PooledConnection(self, mysql.connector.connect(**self.config))
+
+    def checkout(self, timeout=None):
+        scope = current_scope()
+        if scope is not None:
+            scope.check()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._available:
+            if self._closed:
+                raise PoolExhaustedError('Пул соединений закрыт')
+            waited = False
+            while not self._idle and self._created >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolExhaustedError('Нет свободных соединений с базой данных')
+                if not waited:
+                    self._stats['waits'] += 1
+                    waited = True
+                self._available.wait(remaining)
+            pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                self._created += 1
+            self._stats['checkouts'] += 1
+            self._stats['max_in_use'] = max(self._stats['max_in_use'], self._created - len(self._idle))
+        try:
+            pooled = self._connect() if pooled is None else self._ensure_alive(pooled)
+        except Exception:
+            with self._available:
+                self._created -= 1
+                self._available.notify()
+            raise
+        if scope is not None:
+            scope.register(pooled)
+        return pooled
+
+    def _ensure_alive(self, pooled):
+        if not pooled.is_stale():
+            return pooled
+        with self._lock:
+            self._stats['health_checks'] += 1
+        try:
+            pooled.connection.ping(reconnect=False)
+            return pooled
+        except mysql.connector.Error:
+            with self._lock:
+                self._stats['reconnects'] += 1
+            try:
+                pooled.connection.close()
+            except mysql.connector.Error:
+                pass
+            return self._connect()
+
+    def checkin(self, pooled, discard=False):
+        scope = current_scope()
+        if scope is not None:
+            scope.unregister(pooled)
+        if not discard and pooled.connection.in_transaction:
+            try:
+                pooled.connection.rollback()
+            except mysql.connector.Error:
+                discard = True
+        with self._available:
+            if discard or self._closed:
+                self._created -= 1
+                self._stats['discarded'] += 1
+                try:
+                    pooled.connection.close()
+                except mysql.connector.Error:
+                    pass
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+            self._available.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        pooled = self.checkout(timeout)
+        discard = False
+        try:
+            yield pooled.connection
+        except (mysql.connector.OperationalError, mysql.connector.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.checkin(pooled, discard)
+
+    def kill_queries(self, connection_ids):
+        connection = mysql.connector.connect(**self.config)
+        try:
+            cursor = connection.cursor()
+            for connection_id in connection_ids:
+                try:
+                    cursor.execute("KILL QUERY %s", (connection_id,))
+                except mysql.connector.Error:
+                    continue
+                with self._lock:
+                    self._stats['killed_queries'] += 1
+            cursor.close()
+        finally:
+            connection.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(size=self.size, created=self._created, idle=len(self._idle),
+                         in_use=self._created - len(self._idle))
+        return stats
+
+    def close(self):
+        with self._available:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._created -= len(idle)
+            self._available.notify_all()
+        for pooled in idle:
+            try:
+                pooled.connection.close()
+            except mysql.connector.Error:
+                pass
+
+
+class TransactionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'attempts': 0, 'commits': 0, 'retries': 0, 'deadlocks': 0, 'lock_timeouts': 0,
+                       'failures': 0, 'locking_reads': 0, 'lock_waits': 0, 'lock_wait_time': 0.0}
+
+    def record(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def normalize_query(query):
+    query = WHITESPACE.sub(' ', query).strip()
+    query = IN_LIST.sub('IN (%s, ...)', query)
+    return VALUE_GROUPS.sub(r'\1, ...', query)
+
+
+def param_shape(params):
+    if params is None:
+        return '-'
+    if isinstance(params, dict):
+        return '{' + ', '.join(sorted(params)) + '}'
+    types = [type(value).__name__ for value in params]
+    if len(types) > 8:
+        return f"[{len(types)} x {', '.join(sorted(set(types)))}]"
+    return '(' + ', '.join(types) + ')'
+
+
+_query_context = threading.local()
+_query_scope = threading.local()
+
+
+class QueryScope:
+    def __init__(self, kill_delay=KILL_QUERY_DELAY):
+        self.kill_delay = kill_delay
+        self.cancelled = False
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def check(self):
+        if self.cancelled:
+            raise QueryCancelled()
+
+    def register(self, pooled):
+        with self._lock:
+            self._connections[id(pooled)] = pooled
+
+    def unregister(self, pooled):
+        with self._lock:
+            self._connections.pop(id(pooled), None)
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            running = bool(self._connections)
+        if running:
+            timer = threading.Timer(self.kill_delay, self.kill)
+            timer.daemon = True
+            timer.start()
+
+    def kill(self):
+        with self._lock:
+            if not self._connections:
+                return
+            pool = next(iter(self._connections.values())).pool
+            try:
+                pool.kill_queries([pooled.connection_id for pooled in self._connections.values()])
+            except mysql.connector.Error:
+                pass
+
+
+@contextmanager
+def query_scope(scope):
+    previous = getattr(_query_scope, 'scope', None)
+    _query_scope.scope = scope
+    try:
+        yield
+    finally:
+        _query_scope.scope = previous
+
+
+def current_scope():
+    return getattr(_query_scope, 'scope', None)
+
+
+@contextmanager
+def query_context(name):
+    previous = getattr(_query_context, 'name', None)
+    _query_context.name = name
+    try:
+        yield
+    finally:
+        _query_context.name = previous
+
+
+def query_caller():
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    method = f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}" if frame is not None else '?'
+    context = getattr(_query_context, 'name', None)
+    return f"{context} > {method}" if context else method
+
+
+class QueryStats:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, slow_query_log=SLOW_QUERY_LOG, buckets=QUERY_BUCKETS):
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_log = slow_query_log
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self.reset()
+
+    def configure(self, slow_query_ms=None, slow_query_log=None):
+        if slow_query_ms is not None:
+            self.slow_query_ms = slow_query_ms
+        if slow_query_log is not None:
+            self.slow_query_log = slow_query_log or None
+
+    def reset(self):
+        with self._lock:
+            self._queries = {}
+            self._slow = deque(maxlen=SLOW_QUERY_HISTORY)
+
+    def record(self, query, caller, params, elapsed, rows, error=None):
+        query = normalize_query(query)
+        slow = elapsed * 1000 >= self.slow_query_ms
+        with self._lock:
+            entry = self._queries.get((query, caller))
+            if entry is None:
+                entry = self._queries[(query, caller)] = {
+                    'query': query, 'caller': caller, 'count': 0, 'errors': 0, 'rows': 0, 'slow': 0,
+                    'total_time': 0.0, 'max_time': 0.0, 'buckets': [0] * len(self.buckets)
+                }
+            entry['count'] += 1
+            entry['rows'] += rows
+            entry['total_time'] += elapsed
+            entry['max_time'] = max(entry['max_time'], elapsed)
+            if error is not None:
+                entry['errors'] += 1
+            position = bisect.bisect_left(self.buckets, elapsed)
+            if position < len(self.buckets):
+                entry['buckets'][position] += 1
+            if slow:
+                entry['slow'] += 1
+                record = {'time': datetime.now().isoformat(timespec='seconds'), 'elapsed': elapsed, 'rows': rows,
+                          'caller': caller, 'params': param_shape(params), 'query': query,
+                          'error': str(error) if error is not None else None}
+                self._slow.append(record)
+        if slow and self.slow_query_log:
+            self._write_slow(record)
+
+    def _write_slow(self, record):
+        line = (f"{record['time']} {record['elapsed'] * 1000:.1f} ms rows={record['rows']} "
+                f"caller={record['caller']} params={record['params']} query={record['query']}")
+        if record['error']:
+            line += f" error={record['error']}"
+        try:
+            with self._log_lock, open(self.slow_query_log, 'a', encoding='utf-8') as log:
+                log.write(line + '\n')
+        except OSError:
+            pass
+
+    def snapshot(self):
+        with self._lock:
+            return [dict(entry, buckets=list(entry['buckets'])) for entry in self._queries.values()]
+
+    def slow_queries(self):
+        with self._lock:
+            return list(self._slow)
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, stats=None):
+        self._cursor = cursor
+        self._stats = stats or query_stats
+        self._pending = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, query, params=None):
+        self.finish()
+        scope = current_scope()
+        if scope is not None:
+            scope.check()
+        caller = query_caller()
+        started = time.perf_counter()
+        try:
+            result = self._cursor.execute(query, params)
+        except Exception as e:
+            self._stats.record(query, caller, params, time.perf_counter() - started, 0, e)
+            raise
+        self._pending = {'query': query, 'caller': caller, 'params': params,
+                         'elapsed': time.perf_counter() - started, 'rows': 0}
+        if self._cursor.description is None:
+            self._pending['rows'] = max(self._cursor.rowcount, 0)
+            self.finish()
+        return result
+
+    def _fetch(self, fetch, *args):
+        started = time.perf_counter()
+        result = fetch(*args)
+        if self._pending is not None:
+            self._pending['elapsed'] += time.perf_counter() - started
+            if isinstance(result, list):
+                self._pending['rows'] += len(result)
+            elif result is not None:
+                self._pending['rows'] += 1
+        return result
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=1):
+        return self._fetch(self._cursor.fetchmany, size)
+
+    def finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            self._stats.record(pending['query'], pending['caller'], pending['params'], pending['elapsed'],
+                               pending['rows'])
+
+    def close(self):
+        self.finish()
+        return self._cursor.close()
+
+
+transaction_stats = TransactionStats()
+query_stats = QueryStats()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+def configure_pool(**config):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(**config)
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def insert_rows(cursor, table, columns, rows):
+    rows = list(rows)
+    if not rows:
+        return 0
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([placeholders] * len(rows))}"
+    cursor.execute(query, [value for row in rows for value in row])
+    return cursor.rowcount
+
+
+def sync_links(cursor, table, owner_column, owner_id, link_column, link_ids, existing=None):
+    if existing is None:
+        cursor.execute(f"SELECT {link_column} FROM {table} WHERE {owner_column} = %s", (owner_id,))
+        existing = [row[link_column] for row in cursor.fetchall()]
+    existing, wanted = set(existing), set(link_ids)
+    removed, added = existing - wanted, wanted - existing
+    if removed:
+        placeholders = ', '.join(['%s'] * len(removed))
+        cursor.execute(f"DELETE FROM {table} WHERE {owner_column} = %s AND {link_column} IN ({placeholders})",
+                       (owner_id, *removed))
+    insert_rows(cursor, table, (owner_column, link_column), [(owner_id, link_id) for link_id in added])
+    return added, removed
+
+
+class DatabaseConnection:
+    def __init__(self, pool=None):
+        self.pool = pool or get_pool()
+
+    @contextmanager
+    def cursor(self):
+        with self.pool.connection() as connection:
+            cursor = InstrumentedCursor(connection.cursor(dictionary=True))
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        with self.pool.connection() as connection:
+            connection.start_transaction()
+            cursor = InstrumentedCursor(connection.cursor(dictionary=True))
+            try:
+                yield cursor
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def run_transaction(self, fn, *args, isolation_level='REPEATABLE READ', retries=TRANSACTION_RETRIES,
+                        **kwargs):
+        for attempt in range(retries + 1):
+            transaction_stats.record('attempts')
+            try:
+                pooled = self.pool.checkout()
+                connection = pooled.connection
+                cursor = InstrumentedCursor(connection.cursor(dictionary=True))
+                discard = False
+                try:
+                    cursor.execute("SET @previous_lock_wait = @@SESSION.innodb_lock_wait_timeout, "
+                                   "SESSION innodb_lock_wait_timeout = %s", (LOCK_WAIT_TIMEOUT,))
+                    connection.start_transaction(isolation_level=isolation_level)
+                    result = fn(cursor, *args, **kwargs)
+                    connection.commit()
+                except Exception as e:
+                    discard = isinstance(e, (mysql.connector.OperationalError, mysql.connector.InterfaceError))
+                    try:
+                        connection.rollback()
+                    except mysql.connector.Error:
+                        discard = True
+                    raise
+                finally:
+                    try:
+                        if not discard:
+                            cursor.execute("SET SESSION innodb_lock_wait_timeout = @previous_lock_wait")
+                            cursor.close()
+                    except mysql.connector.Error:
+                        discard = True
+                    self.pool.checkin(pooled, discard)
+                transaction_stats.record('commits')
+                return result
+            except mysql.connector.Error as e:
+                if e.errno not in (ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT):
+                    raise
+                transaction_stats.record('deadlocks' if e.errno == ER_LOCK_DEADLOCK else 'lock_timeouts')
+                if attempt == retries:
+                    transaction_stats.record('failures')
+                    raise
+                transaction_stats.record('retries')
+                time.sleep(RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def locking_read(self, cursor, query, params=None):
+        started = time.monotonic()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        elapsed = time.monotonic() - started
+        transaction_stats.record('locking_reads')
+        if elapsed > LOCK_WAIT_THRESHOLD:
+            transaction_stats.record('lock_waits')
+            transaction_stats.record('lock_wait_time', elapsed)
+        return rows
+
+    @contextmanager
+    def streaming_cursor(self):
+        pooled = self.pool.checkout()
+        connection = pooled.connection
+        cursor = InstrumentedCursor(connection.cursor(buffered=False))
+        discard = False
+        try:
+            yield cursor
+        except Exception:
+            discard = True
+            raise
+        finally:
+            cursor.finish()
+            discard = discard or connection.unread_result
+            try:
+                if not discard:
+                    cursor.close()
+            except mysql.connector.Error:
+                discard = True
+            self.pool.checkin(pooled, discard)
+
+    def fetchall(self, query, params=None):
+        with self.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    def fetch_columns(self, query, params=None):
+        with self.pool.connection() as connection:
+            cursor = InstrumentedCursor(connection.cursor())
+            try:
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                names = [column[0] for column in cursor.description]
+            finally:
+                cursor.close()
+        if not rows:
+            return {name: [] for name in names}
+        return dict(zip(names, map(list, zip(*rows))))
+
+    def fetchone(self, query, params=None):
+        with self.cursor() as cursor:
+            cursor.execute(query, params)
+            row = cursor.fetchone()
+            cursor.fetchall()
+            return row
+
+    def execute(self, query, params=None):
+        with self.transaction() as cursor:
+            cursor.execute(query, params)
+            return cursor.lastrowid
@@ -1,43 +1,105 @@
 import sys
 import os
-import mysql.connector
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                             QPushButton, QLabel, QLineEdit, QTabWidget, QTableWidget, QTableWidgetItem,
+                             QPushButton, QLabel, QLineEdit, QTabWidget, QTableView,
                              QComboBox, QHeaderView, QMessageBox, QGroupBox, QTimeEdit, QTextEdit, QDialog,
-                             QFileDialog, QGridLayout, QCheckBox, QScrollArea, QAbstractItemView, QFormLayout,
-                             QDateEdit, QCalendarWidget, QListWidget, QListWidgetItem)
-from PyQt5.QtCore import Qt, QDate, QRegExp, QTime, QSize, QEvent
+                             QFileDialog, QGridLayout, QAbstractItemView, QFormLayout, QTreeView,
+                             QDateEdit, QCalendarWidget, QListWidget, QListWidgetItem, QProgressDialog, QCompleter)
+from PyQt5.QtCore import (Qt, QDate, QRegExp, QTime, QSize, QEvent, QStringListModel, QTimer,
+                          QSortFilterProxyModel)
 from PyQt5.QtGui import QColor, QIntValidator, QRegExpValidator, QPalette, QIcon
-
-
-class DatabaseConnection:
-    def __init__(self):
-        self.connection = mysql.connector.connect(
-            host="127.0.0.1",
-            user="admin",
-            password="admin",
-            database="stomat",
-            autocommit=True
-        )
-        self.cursor = self.connection.cursor(dictionary=True)
+import analytics
+from cache import LRUCache, reference_cache
+from database import close_pool, get_pool, query_stats, transaction_stats
+from export import EXPORT_FORMATS, export_report
+from metrics import start_exporters, stop_exporters, write_metrics
+from migrations import migrate, verify_schema
+from models import PagedTableModel, RecordTableModel, CheckableTreeModel
+from repository import (AppointmentRepository, ConflictError, DoctorRepository, NotFoundError, PatientRepository,
+                        ReportRepository, ServiceRepository, ValidationError)
+from workers import DebouncedSearch, RequestScheduler, TaskCancelled, TaskRunner, change_feed
+
+PATIENT_PAGE_SIZE = 200
+PATIENT_SEARCH_DELAY = 250
+PATIENT_SEARCH_LIMIT = 20
+SERVICE_TABLE_DATA = ['services', 'service_doctors', 'doctors']
+APPOINTMENT_FORM_DATA = ['doctors', 'services', 'service_doctors', 'specialties']
+SERVICE_PICKER_COLUMNS = [('Услуга', 'name_serv'), ('Цена', 'price', Qt.AlignRight | Qt.AlignVCenter),
+                          ('Мин.', 'exec_time', Qt.AlignRight | Qt.AlignVCenter)]
+NO_SPECIALTY_GROUP = 'Без специализации'
+APPOINTMENT_REFRESH_ENTITIES = {'doctors', 'services', 'schedule'}
+SCHEDULE_CACHE_MONTHS = 48
+DAY_CACHE_SIZE = 60
+DAY_PREFETCH_DAYS = 3
+NAVIGATION_DELAY = 150
+SLOT_SEARCH_DAYS = 7
+SLOT_SEARCH_LIMIT = 10
+REPORT_TYPES = {
+    'services': 'Выручка по услугам',
+    'doctors': 'Выручка по врачам',
+    'specialties': 'Выручка по специализациям',
+    'cabinets': 'Выручка по кабинетам',
+    'weekday_hour': 'Выручка по дням недели и часам',
+    'average_ticket': 'Средний чек',
+    'patient_mix': 'Новые и повторные пациенты'
+}
+WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+DIAGNOSTICS_REFRESH_MS = 2000
+CONFLICT_RESOURCES = {
+    'doctor': 'врача',
+    'cabinet': 'кабинета',
+    'patient': 'пациента'
+}
+
+
+def doctor_name(doctor):
+    return f"{doctor['surname_d']} {doctor['name_d']} {doctor['patron_d']}"
+
+
+def group_services(services, service_doctors, doctors, specialties):
+    doctor_specialties = {doctor['dent_id']: doctor['special'] for doctor in doctors}
+    service_specialties = {}
+    for link in service_doctors:
+        specialty = doctor_specialties.get(link['dent_id'])
+        if specialty is not None:
+            service_specialties.setdefault(link['serv_id'], set()).add(specialty)
+    groups = [(specialty['name_sp'], [service for service in services
+                                      if specialty['id_special'] in service_specialties.get(service['serv_id'], ())])
+              for specialty in specialties]
+    groups.append((NO_SPECIALTY_GROUP, [service for service in services
+                                        if service['serv_id'] not in service_specialties]))
+    return [(name, rows) for name, rows in groups if rows]
+
+
+def patient_label(patient):
+    return f"{patient['surname_p']} {patient['name_p']} {patient['patron_p']} ({patient['snils_id']})"
+
+
+def shift_month(year, month, offset):
+    year, month = divmod(year * 12 + month - 1 + offset, 12)
+    return year, month + 1
 
 
 class AddEditDoctorDialog(QDialog):
     def __init__(self, doctor_data=None, parent=None):
         super().__init__(parent)
         self.doctor_data = doctor_data
-        self.db = DatabaseConnection()
         self.specialties = {}
         self.initUI()
+        self.tasks = TaskRunner(self, [self.special_input, self.save_btn])
+        self.load_specialties()
 
     def load_specialties(self):
-        try:
-            self.db.cursor.execute("SELECT id_special, name_sp FROM special")
-            specialties = self.db.cursor.fetchall()
-            self.specialties = {spec['name_sp']: spec['id_special'] for spec in specialties}
-            self.special_input.addItems(self.specialties.keys())
-        except Exception as e:
-            QMessageBox.critical(self, 'Ошибка', f'Ошибка при загрузке специальностей: {str(e)}')
+        reference_cache.load(self.tasks, ['specialties'], lambda data: self.set_specialties(*data),
+                             error_message='Ошибка при загрузке специальностей')
+
+    def set_specialties(self, specialties):
+        self.specialties = {spec['name_sp']: spec['id_special'] for spec in specialties}
+        self.special_input.addItems(self.specialties.keys())
+        if self.doctor_data:
+            index = self.special_input.findText(self.doctor_data.get('specialty_name'))
+            if index >= 0:
+                self.special_input.setCurrentIndex(index)
 
     def initUI(self):
         layout = QGridLayout()
@@ -47,7 +109,6 @@ class AddEditDoctorDialog(QDialog):
         self.special_input = QComboBox()
         self.exper_input = QLineEdit()
         self.num_cab_input = QLineEdit()
-        self.load_specialties()
         validator = QRegExpValidator(QRegExp("[А-Яа-яЁё-]+"))
         for field in [self.surname_d_input, self.name_d_input, self.patron_d_input]:
             field.setValidator(validator)
@@ -66,10 +127,6 @@ class AddEditDoctorDialog(QDialog):
         self.patron_d_input.setText(self.doctor_data['patron_d'])
         self.exper_input.setText(str(self.doctor_data['exper']))
         self.num_cab_input.setText(str(self.doctor_data['num_cab']))
-        specialty_name = self.doctor_data.get('specialty_name')
-        index = self.special_input.findText(specialty_name)
-        if index >= 0:
-            self.special_input.setCurrentIndex(index)
 
     def setup_layout(self, layout):
         fields = [('Фамилия:', self.surname_d_input), ('Имя:', self.name_d_input),
@@ -79,11 +136,11 @@ class AddEditDoctorDialog(QDialog):
             layout.addWidget(QLabel(label), i, 0)
             layout.addWidget(field, i, 1)
         btn_layout = QHBoxLayout()
-        save_btn = QPushButton('Сохранить')
+        self.save_btn = QPushButton('Сохранить')
         cancel_btn = QPushButton('Отмена')
-        save_btn.clicked.connect(self.validate_and_accept)
+        self.save_btn.clicked.connect(self.validate_and_accept)
         cancel_btn.clicked.connect(self.reject)
-        btn_layout.addWidget(save_btn)
+        btn_layout.addWidget(self.save_btn)
         btn_layout.addWidget(cancel_btn)
         layout.addLayout(btn_layout, len(fields), 0, 1, 2)
         self.setLayout(layout)
@@ -114,20 +171,23 @@ class AddEditDoctorDialog(QDialog):
 class DoctorManagementTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.db = DatabaseConnection()
+        self.repository = DoctorRepository()
         self.doctors = []
+        self.reference_versions = None
         self.setupUI()
-        self.load_doctors()
+        self.tasks = TaskRunner(self, [self.doctor_table])
+        change_feed.changed.connect(self.on_data_changed)
 
     def setupUI(self):
         layout = QVBoxLayout(self)
-        self.doctor_table = QTableWidget()
-        self.doctor_table.setColumnCount(6)
-        self.doctor_table.setHorizontalHeaderLabels(
-            ['Фамилия', 'Имя', 'Отчество', 'Специализация', 'Стаж (лет)', 'Кабинет'])
-        self.doctor_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.doctor_table.setSelectionMode(QTableWidget.SingleSelection)
-        self.doctor_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.doctor_model = RecordTableModel([('Фамилия', 'surname_d'), ('Имя', 'name_d'), ('Отчество', 'patron_d'),
+                                              ('Специализация', 'specialty_name'), ('Стаж (лет)', 'exper'),
+                                              ('Кабинет', 'num_cab')], self)
+        self.doctor_table = QTableView()
+        self.doctor_table.setModel(self.doctor_model)
+        self.doctor_table.setSelectionBehavior(QTableView.SelectRows)
+        self.doctor_table.setSelectionMode(QTableView.SingleSelection)
+        self.doctor_table.setEditTriggers(QTableView.NoEditTriggers)
         [header.setSectionResizeMode(i, QHeaderView.Stretch)
          for i, header in enumerate([self.doctor_table.horizontalHeader()] * 6)]
         buttons = QHBoxLayout()
@@ -141,63 +201,49 @@ class DoctorManagementTab(QWidget):
         layout.addWidget(self.doctor_table)
         layout.addLayout(buttons)
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.reference_versions != reference_cache.versions(['doctors']):
+            self.load_doctors()
+
+    def on_data_changed(self, change_set):
+        if self.isVisible() and self.reference_versions != reference_cache.versions(['doctors']):
+            self.load_doctors()
+
     def load_doctors(self):
-        self.doctor_table.setRowCount(0)
-        try:
-            self.db.cursor.execute("""
-                SELECT d.*, s.name_sp as specialty_name 
-                FROM dentists d
-                JOIN special s ON d.special = s.id_special
-                ORDER BY d.surname_d, d.name_d
-            """)
-            self.doctors = self.db.cursor.fetchall()
-            for row, doc in enumerate(self.doctors):
-                self.doctor_table.insertRow(row)
-                for col, key in enumerate(['surname_d', 'name_d', 'patron_d',
-                                           'specialty_name', 'exper', 'num_cab']):
-                    self.doctor_table.setItem(row, col, QTableWidgetItem(str(doc[key])))
-        except Exception as e:
-            QMessageBox.critical(self, 'Ошибка', f'Ошибка загрузки: {e}')
+        self.reference_versions = reference_cache.versions(['doctors'])
+        reference_cache.load(self.tasks, ['doctors'], lambda data: self.set_doctors(*data),
+                             error_message='Ошибка загрузки')
+
+    def set_doctors(self, doctors):
+        self.doctors = doctors
+        self.doctor_model.set_rows(doctors)
 
     def add_doctor(self):
         dialog = AddEditDoctorDialog(parent=self)
         if dialog.exec_() == QDialog.Accepted:
-            try:
-                data = dialog.get_doctor_data()
-                self.db.cursor.execute("""
-                    INSERT INTO dentists (surname_d, name_d, patron_d, special, exper, num_cab)
-                    VALUES (%(surname_d)s, %(name_d)s, %(patron_d)s, %(special)s, %(exper)s, %(num_cab)s)
-                """, data)
-                self.db.connection.commit()
-                self.load_doctors()
-            except Exception as e:
-                self.db.connection.rollback()
-                QMessageBox.critical(self, 'Ошибка', f'Ошибка добавления: {e}')
+            self.tasks.run(self.repository.create, dialog.get_doctor_data(), on_result=self.on_doctors_changed,
+                           error_message='Ошибка добавления')
 
     def edit_doctor(self):
-        if self.doctor_table.currentRow() < 0:
+        if self.doctor_table.currentIndex().row() < 0:
             QMessageBox.warning(self, 'Предупреждение', 'Выберите врача')
             return
-        dialog = AddEditDoctorDialog(self.doctors[self.doctor_table.currentRow()], self)
+        doctor = self.doctors[self.doctor_table.currentIndex().row()]
+        dialog = AddEditDoctorDialog(doctor, self)
         if dialog.exec_() == QDialog.Accepted:
-            try:
-                data = dialog.get_doctor_data()
-                data['dent_id'] = self.doctors[self.doctor_table.currentRow()]['dent_id']
-                self.db.cursor.execute("""
-                    UPDATE dentists
-                    SET surname_d=%(surname_d)s, name_d=%(name_d)s, patron_d=%(patron_d)s,
-                        special=%(special)s, exper=%(exper)s, num_cab=%(num_cab)s
-                    WHERE dent_id=%(dent_id)s
-                """, data)
-                self.db.connection.commit()
-                self.load_doctors()
-                QMessageBox.information(self, 'Успех', 'Данные обновлены')
-            except Exception as e:
-                self.db.connection.rollback()
-                QMessageBox.critical(self, 'Ошибка', f'Ошибка обновления: {e}')
+            self.tasks.run(self.repository.update, doctor['dent_id'], dialog.get_doctor_data(),
+                           on_result=self.on_doctor_updated, error_message='Ошибка обновления')
+
+    def on_doctor_updated(self, _):
+        self.on_doctors_changed()
+        QMessageBox.information(self, 'Успех', 'Данные обновлены')
+
+    def on_doctors_changed(self, _=None):
+        self.load_doctors()
 
     def delete_doctor(self):
-        row = self.doctor_table.currentRow()
+        row = self.doctor_table.currentIndex().row()
         if row < 0:
             QMessageBox.warning(self, 'Предупреждение', 'Выберите врача')
             return
@@ -205,56 +251,37 @@ class DoctorManagementTab(QWidget):
         if QMessageBox.question(self, 'Подтверждение',
                                 f'Удалить врача {doc["surname_d"]} {doc["name_d"]} {doc["patron_d"]}?',
                                 QMessageBox.Yes | QMessageBox.No) == QMessageBox.Yes:
-            try:
-                self.db.cursor.execute("DELETE FROM dentists WHERE dent_id = %s", (doc['dent_id'],))
-                self.db.connection.commit()
-                self.load_doctors()
-            except Exception as e:
-                self.db.connection.rollback()
-                QMessageBox.critical(self, 'Ошибка', f'Ошибка удаления: {e}')
-
-    def closeEvent(self, event):
-        if hasattr(self, 'db'):
-            self.db.connection.close()
-        super().closeEvent(event)
+            self.tasks.run(self.repository.delete, doc['dent_id'], on_result=self.on_doctors_changed, error_message='Ошибка удаления')
 
 
 class AddEditServiceDialog(QDialog):
     def __init__(self, service_data=None, parent=None):
         super().__init__(parent)
         self.service_data = service_data
-        self.db = DatabaseConnection()
         self.doctors = []
         self.initUI()
+        self.tasks = TaskRunner(self, [self.doctors_list, self.save_btn])
         self.load_doctors()
 
     def load_doctors(self):
-        try:
-            self.db.cursor.execute("""
-                SELECT d.dent_id, d.surname_d, d.name_d, d.patron_d, s.name_sp 
-                FROM dentists d
-                LEFT JOIN special s ON d.special = s.id_special
-                ORDER BY d.surname_d
-            """)
-            self.doctors = self.db.cursor.fetchall()
-            selected_doctors = []
-            if self.service_data:
-                self.db.cursor.execute("""
-                    SELECT dent_id FROM service_doctors 
-                    WHERE serv_id = %s
-                """, (self.service_data['serv_id'],))
-                selected_doctors = [row['dent_id'] for row in self.db.cursor.fetchall()]
-            for doctor in self.doctors:
-                name_initial = doctor['name_d'][0] if doctor['name_d'] else ''
-                patron_initial = doctor['patron_d'][0] if doctor['patron_d'] else ''
-                doctor_name = f"{doctor['surname_d']} {name_initial}.{patron_initial}. ({doctor['name_sp']})"
-                item = QListWidgetItem(doctor_name)
-                item.setData(Qt.UserRole, doctor['dent_id'])
-                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
-                item.setCheckState(Qt.Checked if doctor['dent_id'] in selected_doctors else Qt.Unchecked)
-                self.doctors_list.addItem(item)
-        except Exception as e:
-            QMessageBox.critical(self, 'Ошибка', f'Ошибка при загрузке списка врачей: {str(e)}')
+        reference_cache.load(self.tasks, ['doctors', 'service_doctors'], lambda data: self.set_doctors(*data),
+                             error_message='Ошибка при загрузке списка врачей')
+
+    def set_doctors(self, doctors, service_doctors):
+        self.doctors = doctors
+        selected_doctors = set()
+        if self.service_data:
+            selected_doctors = {row['dent_id'] for row in service_doctors
+                                if row['serv_id'] == self.service_data['serv_id']}
+        for doctor in self.doctors:
+            name_initial = doctor['name_d'][0] if doctor['name_d'] else ''
+            patron_initial = doctor['patron_d'][0] if doctor['patron_d'] else ''
+            doctor_name = f"{doctor['surname_d']} {name_initial}.{patron_initial}. ({doctor['specialty_name']})"
+            item = QListWidgetItem(doctor_name)
+            item.setData(Qt.UserRole, doctor['dent_id'])
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if doctor['dent_id'] in selected_doctors else Qt.Unchecked)
+            self.doctors_list.addItem(item)
 
     def initUI(self):
         layout = QGridLayout()
@@ -279,10 +306,10 @@ class AddEditServiceDialog(QDialog):
         layout.addWidget(QLabel('Время выполнения (мин.):'), 3, 0)
         layout.addWidget(self.time_input, 3, 1)
         btn_layout = QHBoxLayout()
-        save_btn, cancel_btn = QPushButton('Сохранить'), QPushButton('Отмена')
-        save_btn.clicked.connect(self.validate_and_accept)
+        self.save_btn, cancel_btn = QPushButton('Сохранить'), QPushButton('Отмена')
+        self.save_btn.clicked.connect(self.validate_and_accept)
         cancel_btn.clicked.connect(self.reject)
-        btn_layout.addWidget(save_btn)
+        btn_layout.addWidget(self.save_btn)
         btn_layout.addWidget(cancel_btn)
         layout.addLayout(btn_layout, 4, 0, 1, 2)
         self.setMinimumWidth(400)
@@ -318,8 +345,11 @@ class AddEditServiceDialog(QDialog):
 class ServiceManagementTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.db = DatabaseConnection()
+        self.repository = ServiceRepository()
+        self.reference_versions = None
         self.initUI()
+        self.tasks = TaskRunner(self, [self.service_table])
+        change_feed.changed.connect(self.on_data_changed)
 
     def initUI(self):
         layout = QVBoxLayout()
@@ -331,8 +361,11 @@ class ServiceManagementTab(QWidget):
         self.setLayout(layout)
 
     def create_table(self):
-        table = QTableWidget(0, 4)
-        table.setHorizontalHeaderLabels(['Наименование', 'Цена', 'Врачи', 'Время выполнения (мин.)'])
+        self.service_model = RecordTableModel([('Наименование', 'name_serv'), ('Цена', 'price', Qt.AlignCenter),
+                                               ('Врачи', 'doctors'),
+                                               ('Время выполнения (мин.)', 'exec_time', Qt.AlignCenter)], self)
+        table = QTableView()
+        table.setModel(self.service_model)
         header = table.horizontalHeader()
         header.setSectionResizeMode(0, QHeaderView.Stretch)
         header.setSectionResizeMode(1, QHeaderView.Fixed)
@@ -356,50 +389,39 @@ class ServiceManagementTab(QWidget):
 
     def showEvent(self, event):
         super().showEvent(event)
-        self.load_services()
+        if self.reference_versions != reference_cache.versions(SERVICE_TABLE_DATA):
+            self.load_services()
+
+    def on_data_changed(self, change_set):
+        if self.isVisible() and self.reference_versions != reference_cache.versions(SERVICE_TABLE_DATA):
+            self.load_services()
 
     def load_services(self):
-        try:
-            query = """
-                SELECT s.serv_id, s.name_serv, s.price, s.exec_time,
-                GROUP_CONCAT(CONCAT(d.surname_d, ' ', LEFT(d.name_d, 1), '.', LEFT(d.patron_d, 1), '.') SEPARATOR '\n') as doctors
-                FROM services s
-                LEFT JOIN service_doctors sd ON s.serv_id = sd.serv_id
-                LEFT JOIN dentists d ON sd.dent_id = d.dent_id
-                GROUP BY s.serv_id, s.name_serv, s.price, s.exec_time
-                ORDER BY s.name_serv
-            """
-            self.db.cursor.execute(query)
-            services = self.db.cursor.fetchall()
-            self.service_table.setRowCount(len(services))
-            for row, service in enumerate(services):
-                self.add_table_row(row, service)
-        except Exception as e:
-            QMessageBox.critical(self, 'Ошибка', f'Ошибка при загрузке услуг: {str(e)}')
-
-    def add_table_row(self, row, service):
-        data = ['name_serv', 'price', 'doctors', 'exec_time']
-        items = [QTableWidgetItem(str(service[key])) for key in data]
-        for i, item in enumerate(items):
-            if i in [1, 3]:
-                item.setTextAlignment(Qt.AlignCenter)
-            self.service_table.setItem(row, i, item)
-        items[0].setData(Qt.UserRole, service)
+        self.reference_versions = reference_cache.versions(SERVICE_TABLE_DATA)
+        reference_cache.load(self.tasks, SERVICE_TABLE_DATA, lambda data: self.set_services(*data),
+                             error_message='Ошибка при загрузке услуг')
+
+    def set_services(self, services, service_doctors, doctors):
+        doctor_names = {doctor['dent_id']: f"{doctor['surname_d']} {doctor['name_d'][:1]}.{doctor['patron_d'][:1]}."
+                        for doctor in doctors}
+        service_doctor_names = {}
+        for link in service_doctors:
+            if link['dent_id'] in doctor_names:
+                service_doctor_names.setdefault(link['serv_id'], []).append(doctor_names[link['dent_id']])
+        self.service_model.set_rows([dict(service, doctors='\n'.join(service_doctor_names.get(service['serv_id'], [])))
+                                     for service in services])
+
+    def on_services_changed(self, _=None):
+        self.load_services()
 
     def delete_service(self):
-        row = self.service_table.currentRow()
+        row = self.service_table.currentIndex().row()
         if row < 0:
             QMessageBox.warning(self, 'Предупреждение', 'Выберите услугу для удаления')
             return
-        service_id = self.service_table.item(row, 0).data(Qt.UserRole)['serv_id']
-        try:
-            self.db.cursor.execute("DELETE FROM service_doctors WHERE serv_id = %s", (service_id,))
-            self.db.cursor.execute("DELETE FROM services WHERE serv_id = %s", (service_id,))
-            self.db.connection.commit()
-            self.load_services()
-        except Exception as e:
-            self.db.connection.rollback()
-            QMessageBox.critical(self, 'Ошибка', f'Ошибка при удалении услуги: {str(e)}')
+        service_id = self.service_model.row_data(row)['serv_id']
+        self.tasks.run(self.repository.delete, service_id, on_result=self.on_services_changed,
+                       error_message='Ошибка при удалении услуги')
 
     def add_service(self):
         dialog = AddEditServiceDialog(parent=self)
@@ -407,33 +429,18 @@ class ServiceManagementTab(QWidget):
             self.save_service(dialog.get_service_data())
 
     def edit_service(self):
-        row = self.service_table.currentRow()
+        row = self.service_table.currentIndex().row()
         if row < 0:
             QMessageBox.warning(self, 'Предупреждение', 'Выберите услугу для редактирования')
             return
-        service = self.service_table.item(row, 0).data(Qt.UserRole)
+        service = self.service_model.row_data(row)
         dialog = AddEditServiceDialog(service, parent=self)
         if dialog.exec_() == QDialog.Accepted:
             self.save_service(dialog.get_service_data(), service['serv_id'])
 
     def save_service(self, data, serv_id=None):
-        try:
-            if serv_id:
-                self.db.cursor.execute("""
-                    UPDATE services SET name_serv = %s, price = %s, exec_time = %s WHERE serv_id = %s
-                """, (data['name_serv'], data['price'], data['exec_time'], serv_id))
-                self.db.cursor.execute("DELETE FROM service_doctors WHERE serv_id = %s", (serv_id,))
-            else:
-                self.db.cursor.execute("INSERT INTO services (name_serv, price, exec_time) VALUES (%s, %s, %s)",
-                                       (data['name_serv'], data['price'], data['exec_time']))
-                serv_id = self.db.cursor.lastrowid
-            for dent_id in data['doctors']:
-                self.db.cursor.execute("INSERT INTO service_doctors (serv_id, dent_id) VALUES (%s, %s)", (serv_id, dent_id))
-            self.db.connection.commit()
-            self.load_services()
-        except Exception as e:
-            self.db.connection.rollback()
-            QMessageBox.critical(self, 'Ошибка', f'Ошибка при сохранении услуги: {str(e)}')
+        self.tasks.run(self.repository.save, data, serv_id, on_result=self.on_services_changed,
+                       error_message='Ошибка при сохранении услуги')
 
 
 class DoctorScheduleCalendar(QCalendarWidget):
@@ -518,105 +525,160 @@ class DoctorScheduleCalendar(QCalendarWidget):
         dialog.show()
 
 
+class SlotSearchDialog(QDialog):
+    def __init__(self, slots, doctor_rows, duration, parent=None):
+        super().__init__(parent)
+        self.slots = slots
+        self.setWindowTitle(f"Свободное время ({duration} мин)")
+        self.setMinimumWidth(450)
+        layout = QVBoxLayout()
+        self.slots_list = QListWidget()
+        for slot in slots:
+            doctor = doctor_rows[slot['dent_id']]
+            date = QDate.fromString(slot['date'], Qt.ISODate).toString('dd.MM.yyyy')
+            self.slots_list.addItem(f"{date} {slot['time_s']} — {slot['time_e']}: "
+                                    f"{doctor_name(doctor)} (кабинет {slot['num_cab']})")
+        self.slots_list.setCurrentRow(0)
+        self.slots_list.itemDoubleClicked.connect(self.accept)
+        layout.addWidget(self.slots_list)
+        btn_layout = QHBoxLayout()
+        select_btn = QPushButton('Выбрать')
+        cancel_btn = QPushButton('Отмена')
+        select_btn.clicked.connect(self.accept)
+        cancel_btn.clicked.connect(self.reject)
+        btn_layout.addWidget(select_btn)
+        btn_layout.addWidget(cancel_btn)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+
+    def selected_slot(self):
+        row = self.slots_list.currentRow()
+        return self.slots[row] if row >= 0 else None
+
+
 class AppointmentTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.db = DatabaseConnection()
+        self.repository = AppointmentRepository()
+        self.patients = PatientRepository()
         self.selected_date = None
         self.selected_patient = None
         self.selected_services = []
         self.selected_doctor = None
         self.selected_appointment_id = None
+        self.selected_appointment = None
+        self.patient_matches = {}
+        self.patient_rows = {}
+        self.doctor_rows = {}
+        self.doctor_indexes = {}
+        self.reference_versions = None
+        self.schedule_cache = LRUCache(SCHEDULE_CACHE_MONTHS)
+        self.day_cache = LRUCache(DAY_CACHE_SIZE)
+        self.shown_date = None
+        self.refresh_all = False
+        self.refresh_dates = set()
         self.initUI()
-        self.load_initial_data()
+        self.tasks = TaskRunner(self, [self.appointments_table, self.book_btn, self.cancel_btn, self.change_btn,
+                                       self.find_slot_btn])
+        self.day_requests = RequestScheduler(self.tasks, self.update_appointments_table, NAVIGATION_DELAY)
+        self.schedule_requests = RequestScheduler(self.tasks, self.load_doctor_schedule, NAVIGATION_DELAY)
+        self.patient_search = DebouncedSearch(self.tasks, self.patients.search, self.show_patient_matches,
+                                              PATIENT_SEARCH_DELAY, 2, limit=PATIENT_SEARCH_LIMIT,
+                                              error_message="Ошибка поиска пациентов")
+        change_feed.changed.connect(self.on_data_changed)
 
     def showEvent(self, event):
         super().showEvent(event)
-        self.load_initial_data()
+        self.apply_pending_changes()
+
+    def on_data_changed(self, change_set):
+        if change_set.entities & APPOINTMENT_REFRESH_ENTITIES:
+            self.refresh_all = True
+        elif not change_set.local or change_set.entities - {'appointment'}:
+            for doctor_id, date_str in change_set.doctor_days:
+                self.invalidate_schedule_month((doctor_id, int(date_str[:4]), int(date_str[5:7])))
+            for date_str in change_set.days:
+                self.invalidate_day(date_str)
+            self.refresh_dates |= change_set.days
+        if self.isVisible():
+            self.apply_pending_changes()
+
+    def apply_pending_changes(self):
+        if self.refresh_all:
+            self.clear_schedule_cache()
+            self.clear_day_cache()
+        if self.reference_versions != reference_cache.versions(APPOINTMENT_FORM_DATA):
+            self.load_initial_data()
+        else:
+            if self.refresh_all or self.selected_date in self.refresh_dates:
+                self.update_appointments_table()
+            self.load_doctor_schedule()
+        self.refresh_all = False
+        self.refresh_dates = set()
 
     def load_initial_data(self):
-        try:
-            current_patient = self.patient_combo.currentText()
-            current_doctor = self.doctor_combo.currentText()
-            selected_services = self.get_selected_services()
-            self.load_patients()
-            self.load_doctors()
-            self.load_services()
-            self.update_appointments_table()
-            if current_patient:
-                index = self.patient_combo.findText(current_patient)
-                if index >= 0:
-                    self.patient_combo.setCurrentIndex(index)
-            if current_doctor:
-                index = self.doctor_combo.findText(current_doctor)
-                if index >= 0:
-                    self.doctor_combo.setCurrentIndex(index)
-                    self.on_doctor_changed(index)
-            for checkbox in self.services_checkboxes:
-                checkbox.setChecked(checkbox.text() in selected_services)
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка при обновлении данных: {str(e)}")
+        self.reference_versions = reference_cache.versions(APPOINTMENT_FORM_DATA)
+        reference_cache.load(self.tasks, APPOINTMENT_FORM_DATA, self.set_initial_data,
+                             error_message="Ошибка при обновлении данных")
 
-    def load_patients(self):
-        try:
-            self.patient_combo.clear()
-            query = """
-                SELECT snils_id, CONCAT(surname_p, ' ', name_p, ' ', patron_p, ' (', snils_id, ')') as full_name
-                FROM patients
-                ORDER BY surname_p, name_p
-            """
-            self.db.cursor.execute(query)
-            patients = self.db.cursor.fetchall()
-            self.patient_data = {}
-            for patient in patients:
-                self.patient_combo.addItem(patient['full_name'])
-                self.patient_data[patient['full_name']] = patient['snils_id']
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка загрузки пациентов: {str(e)}")
+    def set_initial_data(self, data):
+        doctors, services, service_doctors, specialties = data
+        current_doctor = self.current_schedule_doctor()
+        selected_services = self.get_selected_services()
+        self.load_doctors(doctors)
+        self.services_model.set_groups(group_services(services, service_doctors, doctors, specialties))
+        if current_doctor in self.doctor_indexes:
+            self.doctor_combo.blockSignals(True)
+            self.doctor_combo.setCurrentIndex(self.doctor_indexes[current_doctor])
+            self.doctor_combo.blockSignals(False)
+        self.services_model.set_checked(selected_services)
+        self.update_services_total()
+        self.update_appointments_table()
+        self.on_doctor_changed(self.doctor_combo.currentIndex())
+
+    def on_patient_text_edited(self, text):
+        self.selected_patient = None
+        self.patient_search.schedule(text)
+
+    def show_patient_matches(self, text, patients):
+        self.patient_matches = {patient_label(patient): patient for patient in patients}
+        self.patient_completer_model.setStringList(list(self.patient_matches))
+        if patients and self.patient_input.hasFocus():
+            self.patient_completer.complete()
+
+    def on_patient_activated(self, label):
+        patient = self.patient_matches.get(label)
+        if patient:
+            self.set_patient(patient)
+
+    def set_patient(self, patient):
+        self.selected_patient = patient['snils_id']
+        self.patient_rows[patient['snils_id']] = patient
+        self.patient_input.setText(patient_label(patient))
+
+    def load_doctors(self, doctors):
+        self.doctor_combo.blockSignals(True)
+        self.doctor_combo.clear()
+        self.doctor_rows = {}
+        self.doctor_indexes = {}
+        for doctor in doctors:
+            self.doctor_indexes[doctor['dent_id']] = self.doctor_combo.count()
+            self.doctor_combo.addItem(doctor_name(doctor), doctor['dent_id'])
+            self.doctor_rows[doctor['dent_id']] = doctor
+        if self.doctor_combo.count() > 0:
+            self.doctor_combo.setCurrentIndex(0)
+        self.doctor_combo.blockSignals(False)
 
-    def load_doctors(self):
-        try:
-            self.doctor_combo.clear()
-            query = """
-                SELECT dent_id, CONCAT(surname_d, ' ', name_d, ' ', patron_d) as full_name
-                FROM dentists
-                ORDER BY surname_d, name_d
-            """
-            self.db.cursor.execute(query)
-            doctors = self.db.cursor.fetchall()
-            self.doctor_data = {}
-            for doctor in doctors:
-                self.doctor_combo.addItem(doctor['full_name'])
-                self.doctor_data[doctor['full_name']] = doctor['dent_id']
-            if self.doctor_combo.count() > 0:
-                self.doctor_combo.setCurrentIndex(0)
-                self.on_doctor_changed(0)
-            self.doctor_combo.currentIndexChanged.connect(self.on_doctor_changed)
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка загрузки врачей: {str(e)}")
+    def get_selected_services(self):
+        return self.services_model.checked_keys()
 
-    def load_services(self):
-        try:
-            query = """
-                SELECT serv_id, name_serv
-                FROM services
-                ORDER BY name_serv
-            """
-            self.db.cursor.execute(query)
-            services = self.db.cursor.fetchall()
-            for checkbox in self.services_checkboxes:
-                self.services_layout.removeWidget(checkbox)
-                checkbox.deleteLater()
-            self.services_checkboxes.clear()
-            self.service_data.clear()
-            for service in services:
-                checkbox = QCheckBox(service['name_serv'])
-                self.services_checkboxes.append(checkbox)
-                self.services_layout.addWidget(checkbox)
-                self.service_data[service['name_serv']] = service['serv_id']
-            self.services_layout.addStretch()
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка загрузки услуг: {str(e)}")
+    def services_total(self, service_ids):
+        return sum(self.services_model.records[serv_id]['price'] for serv_id in service_ids)
+
+    def update_services_total(self):
+        service_ids = self.get_selected_services()
+        duration = sum(self.services_model.records[serv_id]['exec_time'] or 0 for serv_id in service_ids)
+        self.services_total_label.setText(f"Итого: {self.services_total(service_ids):,} руб., {duration} мин.")
 
     def initUI(self):
         main_layout = QHBoxLayout()
@@ -626,36 +688,57 @@ class AppointmentTab(QWidget):
         calendar_layout.addWidget(QLabel("Календарь записей"))
         self.calendar = QCalendarWidget()
         self.calendar.setVerticalHeaderFormat(QCalendarWidget.NoVerticalHeader)
-        self.calendar.clicked.connect(self.update_appointments_table)
+        self.calendar.clicked.connect(self.on_date_clicked)
         calendar_layout.addWidget(self.calendar)
         calendar_layout.addWidget(QLabel("Расписание врача"))
         self.doctor_schedule_calendar = DoctorScheduleCalendar()
+        self.doctor_schedule_calendar.currentPageChanged.connect(self.on_schedule_page_changed)
         calendar_layout.addWidget(self.doctor_schedule_calendar)
         calendar_widget.setLayout(calendar_layout)
         right_widget = QWidget()
         right_layout = QVBoxLayout()
         form_widget = QWidget()
         form_layout = QFormLayout()
-        self.patient_combo = QComboBox()
-        form_layout.addRow("Выберите пациента:", self.patient_combo)
+        self.patient_input = QLineEdit()
+        self.patient_input.setPlaceholderText("Фамилия, СНИЛС или телефон")
+        self.patient_completer_model = QStringListModel(self)
+        self.patient_completer = QCompleter(self.patient_completer_model, self)
+        self.patient_completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.patient_completer.activated[str].connect(self.on_patient_activated)
+        self.patient_input.setCompleter(self.patient_completer)
+        self.patient_input.textEdited.connect(self.on_patient_text_edited)
+        form_layout.addRow("Выберите пациента:", self.patient_input)
         self.services_group = QGroupBox("Выберите услуги:")
         services_layout = QVBoxLayout()
-        services_scroll = QScrollArea()
-        services_scroll.setWidgetResizable(True)
-        services_scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        services_scroll.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        self.services_container = QWidget()
-        self.services_layout = QVBoxLayout(self.services_container)
-        self.services_layout.setSpacing(5)
-        self.services_layout.setContentsMargins(5, 5, 5, 5)
-        self.services_checkboxes = []
-        self.service_data = {}
-        services_scroll.setWidget(self.services_container)
-        services_scroll.setMinimumHeight(150)
-        services_layout.addWidget(services_scroll)
+        self.services_filter = QLineEdit()
+        self.services_filter.setPlaceholderText("Поиск услуги")
+        self.services_filter.setClearButtonEnabled(True)
+        services_layout.addWidget(self.services_filter)
+        self.services_model = CheckableTreeModel(SERVICE_PICKER_COLUMNS, 'serv_id', self)
+        self.services_model.checked_changed.connect(self.update_services_total)
+        self.services_proxy = QSortFilterProxyModel(self)
+        self.services_proxy.setSourceModel(self.services_model)
+        self.services_proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.services_proxy.setFilterKeyColumn(0)
+        self.services_proxy.setRecursiveFilteringEnabled(True)
+        self.services_filter.textChanged.connect(self.filter_services)
+        self.services_view = QTreeView()
+        self.services_view.setModel(self.services_proxy)
+        self.services_view.setUniformRowHeights(True)
+        self.services_view.setSelectionMode(QAbstractItemView.NoSelection)
+        self.services_view.header().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.services_view.header().setSectionResizeMode(1, QHeaderView.ResizeToContents)
+        self.services_view.header().setSectionResizeMode(2, QHeaderView.ResizeToContents)
+        self.services_view.header().setStretchLastSection(False)
+        self.services_view.setMinimumHeight(150)
+        self.services_proxy.rowsInserted.connect(self.expand_services)
+        services_layout.addWidget(self.services_view)
+        self.services_total_label = QLabel()
+        services_layout.addWidget(self.services_total_label)
         self.services_group.setLayout(services_layout)
         form_layout.addRow("Выберите услуги:", self.services_group)
         self.doctor_combo = QComboBox()
+        self.doctor_combo.currentIndexChanged.connect(self.on_doctor_changed)
         form_layout.addRow("Выберите врача:", self.doctor_combo)
         time_widget = QWidget()
         time_layout = QHBoxLayout()
@@ -681,18 +764,24 @@ class AppointmentTab(QWidget):
         """)
         time_layout.addWidget(dash_label)
         time_layout.addWidget(self.end_time)
+        self.find_slot_btn = QPushButton("Найти время")
+        self.find_slot_btn.clicked.connect(self.find_free_slots)
+        time_layout.addWidget(self.find_slot_btn)
         time_layout.addStretch()
         time_widget.setLayout(time_layout)
         form_layout.addRow("Выберите время:", time_widget)
         form_widget.setLayout(form_layout)
         right_layout.addWidget(form_widget)
-        self.appointments_table = QTableWidget()
-        self.appointments_table.setColumnCount(7)
-        self.appointments_table.setHorizontalHeaderLabels(
-            ['Врач', 'Пациент', 'Услуги', 'Кабинет', 'Время начала', 'Время окончания', 'Цена за прием'])
+        self.appointments_model = RecordTableModel([('Врач', 'doctor_name'), ('Пациент', 'patient_name'),
+                                                    ('Услуги', 'services'), ('Кабинет', 'cabinet'),
+                                                    ('Время начала', 'start_time'), ('Время окончания', 'end_time'),
+                                                    ('Цена за прием', 'total_sum')], self)
+        self.appointments_table = QTableView()
+        self.appointments_table.setModel(self.appointments_model)
+        self.appointments_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.appointments_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.appointments_table.setSelectionMode(QAbstractItemView.SingleSelection)
-        self.appointments_table.itemClicked.connect(self.select_appointment)
+        self.appointments_table.clicked.connect(self.select_appointment)
         right_layout.addWidget(QLabel("Записи на выбранную дату:"))
         right_layout.addWidget(self.appointments_table)
         button_layout = QHBoxLayout()
@@ -711,320 +800,361 @@ class AppointmentTab(QWidget):
         main_layout.addWidget(right_widget, 2)
         self.setLayout(main_layout)
 
+    def on_date_clicked(self, date):
+        self.selected_date = date.toString(Qt.ISODate)
+        appointments = self.day_cache.get(self.selected_date)
+        if appointments is not None:
+            self.show_appointments(appointments)
+        self.day_requests.schedule()
+
     def on_doctor_changed(self, index):
-        doctor_name = self.doctor_combo.currentText()
-        if doctor_name in self.doctor_data:
-            doctor_id = self.doctor_data[doctor_name]
-            try:
-                query = """
-                    SELECT 
-                        a.date,
-                        TIME_FORMAT(a.time_s, '%H:%i') as start_time,
-                        TIME_FORMAT(a.time_e, '%H:%i') as end_time,
-                        CONCAT(p.surname_p, ' ', p.name_p) as patient_name,
-                        GROUP_CONCAT(s.name_serv SEPARATOR ', ') as services
-                    FROM appointment a
-                    JOIN patients p ON a.snils = p.snils_id
-                    JOIN app_serv aps ON a.appoint_id = aps.Appoint_id
-                    JOIN services s ON aps.Serv_id = s.serv_id
-                    WHERE a.dent_id = %s
-                    GROUP BY a.appoint_id, a.date, a.time_s, a.time_e, p.surname_p, p.name_p
-                    ORDER BY a.date, a.time_s
-                """
-                self.db.cursor.execute(query, (doctor_id,))
-                appointments = self.db.cursor.fetchall()
-                appointments_by_date = {}
-                for appointment in appointments:
-                    date_str = appointment['date'].strftime('%Y-%m-%d')
-                    if date_str not in appointments_by_date:
-                        appointments_by_date[date_str] = []
-                    appointments_by_date[date_str].append({
-                        'time': f"{appointment['start_time']} - {appointment['end_time']}",
-                        'patient': appointment['patient_name'],
-                        'services': appointment['services']
-                    })
-                self.doctor_schedule_calendar.set_doctor(doctor_id, appointments_by_date)
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Ошибка загрузки расписания: {str(e)}")
-                self.doctor_schedule_calendar.set_doctor(None, {})
+        self.show_doctor_schedule()
+        self.schedule_requests.schedule()
 
-    def get_selected_services(self):
-        return [cb.text() for cb in self.services_checkboxes if cb.isChecked()]
+    def on_schedule_page_changed(self, year, month):
+        self.show_doctor_schedule()
+        self.schedule_requests.schedule()
+
+    def filter_services(self, text):
+        self.services_proxy.setFilterFixedString(text.strip())
+        self.services_view.expandAll()
+
+    def expand_services(self, parent, first, last):
+        if not parent.isValid():
+            for row in range(first, last + 1):
+                self.services_view.expand(self.services_proxy.index(row, 0))
+
+    def current_schedule_doctor(self):
+        return self.doctor_combo.currentData()
+
+    def load_doctor_schedule(self):
+        doctor_id = self.current_schedule_doctor()
+        if doctor_id is None:
+            return
+        year = self.doctor_schedule_calendar.yearShown()
+        month = self.doctor_schedule_calendar.monthShown()
+        self.show_doctor_schedule()
+        months = [(doctor_id, *shift_month(year, month, offset)) for offset in (0, -1, 1)]
+        self.schedule_requests.retain(months)
+        for key in months:
+            self.request_schedule_month(key, busy=key == months[0])
+
+    def request_schedule_month(self, key, busy):
+        if key in self.schedule_cache or key in self.schedule_requests:
+            return
+        self.schedule_requests.request(key, self.fetch_doctor_schedule, *key,
+                                       on_result=lambda result: self.set_doctor_schedule(key, result),
+                                       on_error=lambda e: self.on_doctor_schedule_error(e), busy=busy)
+
+    def fetch_doctor_schedule(self, doctor_id, year, month):
+        month_start = f"{year:04d}-{month:02d}-01"
+        month_end = "{:04d}-{:02d}-01".format(*shift_month(year, month, 1))
+        return self.repository.doctor_schedule(doctor_id, month_start, month_end)
+
+    def set_doctor_schedule(self, key, appointments_by_date):
+        self.schedule_cache.put(key, appointments_by_date)
+        doctor_id, year, month = key
+        if doctor_id == self.current_schedule_doctor():
+            self.show_doctor_schedule()
+
+    def show_doctor_schedule(self):
+        doctor_id = self.current_schedule_doctor()
+        year = self.doctor_schedule_calendar.yearShown()
+        month = self.doctor_schedule_calendar.monthShown()
+        appointments_by_date = {}
+        for offset in (-1, 0, 1):
+            appointments_by_date.update(self.schedule_cache.get((doctor_id, *shift_month(year, month, offset)), {}))
+        self.doctor_schedule_calendar.set_doctor(doctor_id, appointments_by_date)
+
+    def patch_doctor_schedule(self, doctor_id, date_str, appointment_id, appointment=None):
+        month_schedule = self.schedule_cache.get((doctor_id, int(date_str[:4]), int(date_str[5:7])))
+        if month_schedule is None:
+            return
+        appointments = [item for item in month_schedule.get(date_str, []) if item['id'] != appointment_id]
+        if appointment:
+            appointments.append(appointment)
+            appointments.sort(key=lambda item: item['time'])
+        if appointments:
+            month_schedule[date_str] = appointments
+        else:
+            month_schedule.pop(date_str, None)
+
+    def invalidate_schedule_month(self, key):
+        self.schedule_cache.pop(key)
+        self.schedule_requests.cancel(key)
+
+    def clear_schedule_cache(self):
+        self.schedule_cache.clear()
+        self.schedule_requests.cancel_all()
+
+    def on_doctor_schedule_error(self, error):
+        QMessageBox.critical(self, "Ошибка", f"Ошибка загрузки расписания: {str(error)}")
+        self.doctor_schedule_calendar.set_doctor(None, {})
 
     def validate_services(self):
-        selected_services = self.get_selected_services()
-        if not selected_services:
+        if not self.get_selected_services():
             QMessageBox.warning(self, "Ошибка", "Необходимо выбрать хотя бы одну услугу")
-            return False, 0
-        total_sum = self.calculate_total_sum(selected_services)
-        if total_sum <= 0:
-            QMessageBox.warning(self, "Ошибка", "Ошибка расчета суммы услуг")
-            return False, 0
-        return True, total_sum
+            return False
+        return True
+
+    def get_booking_params(self):
+        if not self.validate_services():
+            return None
+        doctor_id = self.current_schedule_doctor()
+        if self.selected_patient is None or doctor_id not in self.doctor_rows:
+            QMessageBox.warning(self, "Ошибка", "Выберите пациента и врача")
+            return None
+        service_ids = self.get_selected_services()
+        return {
+            'appoint_id': self.selected_appointment_id,
+            'dent_id': doctor_id,
+            'snils': self.selected_patient,
+            'services': service_ids,
+            'service_names': [self.services_model.records[serv_id]['name_serv'] for serv_id in service_ids],
+            'time_s': self.start_time.time().toString("HH:mm"),
+            'time_e': self.end_time.time().toString("HH:mm"),
+            'num_cab': self.doctor_rows[doctor_id]['num_cab'],
+            'date': self.selected_date
+        }
+
+    def find_free_slots(self):
+        if not self.validate_services():
+            return
+        service_ids = self.get_selected_services()
+        snils = self.selected_patient
+        start_date = self.calendar.selectedDate().toString(Qt.ISODate)
+        exclude = None
+        if self.selected_appointment_id:
+            reply = QMessageBox.question(self, 'Поиск времени',
+                                         'Подобрать время для переноса выбранной записи?',
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply == QMessageBox.Yes:
+                exclude = self.selected_appointment_id
+        self.tasks.run(self.repository.find_slots, service_ids, snils, start_date, SLOT_SEARCH_DAYS,
+                       SLOT_SEARCH_LIMIT, exclude, on_result=self.show_free_slots, on_error=self.on_slot_search_error)
+
+    def show_free_slots(self, result):
+        duration, slots = result
+        if not slots:
+            QMessageBox.information(self, "Свободное время",
+                                    f"Нет свободного времени на ближайшие {SLOT_SEARCH_DAYS} дней")
+            return
+        dialog = SlotSearchDialog(slots, self.doctor_rows, duration, self)
+        if dialog.exec_() == QDialog.Accepted and dialog.selected_slot():
+            self.apply_slot(dialog.selected_slot())
+
+    def on_slot_search_error(self, error):
+        if isinstance(error, ValidationError):
+            QMessageBox.warning(self, "Ошибка", str(error))
+        else:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка поиска свободного времени: {str(error)}")
+
+    def apply_slot(self, slot):
+        index = self.doctor_indexes.get(slot['dent_id'])
+        if index is not None:
+            self.doctor_combo.setCurrentIndex(index)
+        self.start_time.setTime(QTime.fromString(slot['time_s'], "HH:mm"))
+        self.end_time.setTime(QTime.fromString(slot['time_e'], "HH:mm"))
+        if slot['date'] != self.selected_date:
+            self.calendar.setSelectedDate(QDate.fromString(slot['date'], Qt.ISODate))
+            self.update_appointments_table()
 
     def update_appointments_table(self):
+        selected = self.calendar.selectedDate()
+        self.selected_date = selected.toString(Qt.ISODate)
+        days = [self.selected_date]
+        for offset in range(1, DAY_PREFETCH_DAYS + 1):
+            days += [selected.addDays(offset).toString(Qt.ISODate), selected.addDays(-offset).toString(Qt.ISODate)]
+        self.day_requests.retain(days)
+        appointments = self.day_cache.get(self.selected_date)
+        if appointments is None:
+            self.request_day(self.selected_date, busy=True)
+        elif self.shown_date != self.selected_date:
+            self.show_appointments(appointments)
+        for date in days[1:]:
+            self.request_day(date, busy=False)
+
+    def request_day(self, date, busy):
+        if date in self.day_cache or date in self.day_requests:
+            return
+        self.day_requests.request(date, self.repository.for_day, date,
+                                  on_result=lambda appointments: self.set_day(date, appointments),
+                                  on_error=lambda e: self.on_day_error(date, e), busy=busy)
+
+    def set_day(self, date, appointments):
+        self.day_cache.put(date, appointments)
+        if date == self.selected_date:
+            self.show_appointments(appointments)
+
+    def show_appointments(self, appointments):
+        self.shown_date = self.selected_date
+        self.appointments_model.set_rows(appointments)
+        self.appointments_table.resizeColumnsToContents()
+
+    def on_day_error(self, date, error):
+        if date == self.selected_date:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка обновления таблицы записей: {str(error)}")
+
+    def invalidate_day(self, date):
+        self.day_cache.pop(date)
+        if date in self.day_requests:
+            self.day_requests.cancel(date)
+            if date == self.selected_date:
+                self.request_day(date, busy=True)
+
+    def clear_day_cache(self):
+        self.day_cache.clear()
+        self.day_requests.cancel_all()
+
+    def report_conflicts(self, conflicts):
+        resources = ', '.join(CONFLICT_RESOURCES[resource] for resource in CONFLICT_RESOURCES
+                              if resource in conflicts)
+        QMessageBox.warning(self, "Ошибка", f"На это время уже есть запись для выбранного {resources}.")
+
+    def check_conflicts(self, params):
         try:
-            self.selected_date = self.calendar.selectedDate().toString(Qt.ISODate)
-            self.appointments_table.setRowCount(0)
-            query = """
-                   SELECT 
-                       CONCAT(p.surname_p, ' ', p.name_p, ' ', p.patron_p) as patient_name,
-                       CONCAT(d.surname_d, ' ', d.name_d, ' ', d.patron_d) as doctor_name,
-                       d.num_cab as cabinet,
-                       GROUP_CONCAT(s.name_serv SEPARATOR ', ') as services,
-                       TIME_FORMAT(a.time_s, '%H:%i') as start_time,
-                       TIME_FORMAT(a.time_e, '%H:%i') as end_time,
-                       a.sum as total_sum,
-                       a.appoint_id
-                   FROM appointment a
-                   JOIN patients p ON a.snils = p.snils_id
-                   JOIN dentists d ON a.dent_id = d.dent_id
-                   JOIN app_serv aps ON a.appoint_id = aps.Appoint_id
-                   JOIN services s ON aps.Serv_id = s.serv_id
-                   WHERE a.date = %s
-                   GROUP BY a.appoint_id, p.surname_p, p.name_p, p.patron_p,
-                            d.surname_d, d.name_d, d.patron_d, d.num_cab, a.time_s, a.time_e, a.sum
-                   ORDER BY a.time_s
-               """
-            self.db.cursor.execute(query, (self.selected_date,))
-            appointments = self.db.cursor.fetchall()
-            self.appointment_ids = {}
-            for row, appointment in enumerate(appointments):
-                self.appointments_table.insertRow(row)
-                self.appointments_table.setItem(row, 0, QTableWidgetItem(appointment['doctor_name']))
-                self.appointments_table.setItem(row, 1, QTableWidgetItem(appointment['patient_name']))
-                self.appointments_table.setItem(row, 2, QTableWidgetItem(appointment['services']))
-                self.appointments_table.setItem(row, 3, QTableWidgetItem(str(appointment['cabinet'])))
-                self.appointments_table.setItem(row, 4, QTableWidgetItem(appointment['start_time']))
-                self.appointments_table.setItem(row, 5, QTableWidgetItem(appointment['end_time']))
-                self.appointments_table.setItem(row, 6, QTableWidgetItem(str(appointment['total_sum'])))
-                self.appointment_ids[row] = appointment['appoint_id']
-            self.appointments_table.resizeColumnsToContents()
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка обновления таблицы записей: {str(e)}")
-
-    def calculate_total_sum(self, selected_services):
-        try:
-            services_list = ', '.join(['%s' for _ in selected_services])
-            query = f"""
-                SELECT SUM(price) as total
-                FROM services
-                WHERE name_serv IN ({services_list})
-            """
-            self.db.cursor.execute(query, selected_services)
-            result = self.db.cursor.fetchone()
-            return result['total'] if result['total'] else 0
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка расчета суммы: {str(e)}")
-            return 0
-
-    def get_doctor_cabinet(self, doctor_name):
-        try:
-            query = "SELECT num_cab FROM dentists WHERE dent_id = %s"
-            self.db.cursor.execute(query, (self.doctor_data[doctor_name],))
-            result = self.db.cursor.fetchone()
-            return result['num_cab'] if result else None
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка получения кабинета: {str(e)}")
-            return None
+            conflicts = self.repository.conflicts(params)
+        except ValidationError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+            return False
+        if conflicts:
+            self.report_conflicts(conflicts)
+            return False
+        return True
+
+    def on_write_error(self, error, message):
+        if isinstance(error, ConflictError):
+            self.report_conflicts(error.conflicts)
+        elif isinstance(error, ValidationError):
+            QMessageBox.warning(self, "Ошибка", str(error))
+        else:
+            QMessageBox.critical(self, "Ошибка", f"{message}: {str(error)}")
+
+    def apply_appointment_change(self, previous=None, params=None, result=None):
+        if previous:
+            self.appointments_model.remove_record('appoint_id', previous['appoint_id'])
+            self.patch_doctor_schedule(previous['dent_id'], previous['date'], previous['appoint_id'])
+        if params is not None:
+            self.add_appointment_rows(params, result)
+        for change in (previous, params):
+            if change is not None:
+                self.invalidate_day(change['date'])
+        if self.shown_date == self.selected_date:
+            self.day_cache.put(self.shown_date, list(self.appointments_model.rows))
+        self.show_doctor_schedule()
+
+    def add_appointment_rows(self, params, result):
+        doctor = self.doctor_rows[params['dent_id']]
+        patient = self.patient_rows[params['snils']]
+        services = ', '.join(params['service_names'])
+        if params['date'] == self.selected_date:
+            self.appointments_model.insert_record({
+                'patient_name': f"{patient['surname_p']} {patient['name_p']} {patient['patron_p']}",
+                'doctor_name': doctor_name(doctor),
+                'cabinet': params['num_cab'],
+                'services': services,
+                'start_time': params['time_s'],
+                'end_time': params['time_e'],
+                'total_sum': result['total_sum'],
+                'appoint_id': result['appoint_id'],
+                'dent_id': params['dent_id']
+            }, 'start_time')
+        self.patch_doctor_schedule(params['dent_id'], params['date'], result['appoint_id'], {
+            'id': result['appoint_id'],
+            'time': f"{params['time_s']} - {params['time_e']}",
+            'patient': f"{patient['surname_p']} {patient['name_p']}",
+            'services': services
+        })
 
     def book_appointment(self):
-        try:
-            is_valid, total_sum = self.validate_services()
-            if not is_valid:
-                return
-            current_patient = self.patient_combo.currentText()
-            current_doctor = self.doctor_combo.currentText()
-            selected_services = self.get_selected_services()
-            start_time = self.start_time.time().toString("HH:mm")
-            end_time = self.end_time.time().toString("HH:mm")
-            cabinet = self.get_doctor_cabinet(current_doctor)
-            query = """
-                SELECT COUNT(*) as count
-                FROM appointment
-                WHERE dent_id = %s AND date = %s AND (
-                    (time_s < %s AND time_e > %s) OR
-                    (time_s >= %s AND time_s < %s)
-                )
-            """
-            self.db.cursor.execute(query, (
-                self.doctor_data[current_doctor],
-                self.selected_date,
-                end_time, start_time,
-                start_time, end_time
-            ))
-            conflict_result = self.db.cursor.fetchone()
-            if conflict_result['count'] > 0:
-                QMessageBox.warning(self, "Ошибка", "На это время уже есть запись для выбранного врача.")
-                return
-            query = """
-                INSERT INTO appointment (dent_id, snils, time_s, time_e, num_cab, date, sum)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            self.db.cursor.execute(query, (
-                self.doctor_data[current_doctor],
-                self.patient_data[current_patient],
-                start_time,
-                end_time,
-                cabinet,
-                self.selected_date,
-                total_sum
-            ))
-            appointment_id = self.db.cursor.lastrowid
-            for service_name in selected_services:
-                query = """
-                    INSERT INTO app_serv (Serv_id, Appoint_id)
-                    VALUES (%s, %s)
-                """
-                self.db.cursor.execute(query, (self.service_data[service_name], appointment_id))
-            self.db.connection.commit()
-            self.update_appointments_table()
-            QMessageBox.information(self, "Успех", "Запись успешно создана")
-        except Exception as e:
-            self.db.connection.rollback()
-            QMessageBox.critical(self, "Ошибка", f"Ошибка создания записи: {str(e)}")
+        params = self.get_booking_params()
+        if params is None:
+            return
+        params['appoint_id'] = None
+        if not self.check_conflicts(params):
+            return
+        self.tasks.run(self.repository.save, params, on_result=lambda result: self.on_appointment_booked(params, result),
+                       on_error=lambda e: self.on_write_error(e, "Ошибка создания записи"))
+
+    def on_appointment_booked(self, params, result):
+        self.apply_appointment_change(params=params, result=result)
+        QMessageBox.information(self, "Успех", "Запись успешно создана")
 
     def change_appointment(self):
-        try:
-            if not self.selected_appointment_id:
-                QMessageBox.warning(self, "Ошибка", "Выберите запись для изменения")
-                return
-            is_valid, total_sum = self.validate_services()
-            if not is_valid:
-                return
-            current_patient = self.patient_combo.currentText()
-            current_doctor = self.doctor_combo.currentText()
-            selected_services = self.get_selected_services()
-            start_time = self.start_time.time().toString("HH:mm")
-            end_time = self.end_time.time().toString("HH:mm")
-            cabinet = self.get_doctor_cabinet(current_doctor)
-            query = """
-                SELECT COUNT(*) as count
-                FROM appointment
-                WHERE dent_id = %s 
-                AND date = %s 
-                AND appoint_id != %s 
-                AND (
-                    (time_s < %s AND time_e > %s) OR
-                    (time_s >= %s AND time_s < %s)
-                )
-            """
-            self.db.cursor.execute(query, (
-                self.doctor_data[current_doctor],
-                self.selected_date,
-                self.selected_appointment_id,
-                end_time, start_time,
-                start_time, end_time
-            ))
-            conflict_result = self.db.cursor.fetchone()
-            if conflict_result['count'] > 0:
-                QMessageBox.warning(self, "Ошибка", "На это время уже есть запись для выбранного врача.")
-                return
-            query = """
-                UPDATE appointment 
-                SET dent_id = %s,
-                    snils = %s,
-                    time_s = %s,
-                    time_e = %s,
-                    num_cab = %s,
-                    date = %s,
-                    sum = %s
-                WHERE appoint_id = %s
-            """
-            self.db.cursor.execute(query, (
-                self.doctor_data[current_doctor],
-                self.patient_data[current_patient],
-                start_time,
-                end_time,
-                cabinet,
-                self.selected_date,
-                total_sum,
-                self.selected_appointment_id
-            ))
-            self.db.cursor.execute("DELETE FROM App_serv WHERE Appoint_id = %s",
-                                   (self.selected_appointment_id,))
-            for service_name in selected_services:
-                query = """
-                    INSERT INTO app_serv (Serv_id, Appoint_id)
-                    VALUES (%s, %s)
-                """
-                self.db.cursor.execute(query, (self.service_data[service_name], self.selected_appointment_id))
-            self.db.connection.commit()
-            self.update_appointments_table()
-            self.selected_appointment_id = None
-            QMessageBox.information(self, "Успех", "Запись успешно изменена")
-        except Exception as e:
-            self.db.connection.rollback()
-            QMessageBox.critical(self, "Ошибка", f"Ошибка изменения записи: {str(e)}")
+        if not self.selected_appointment_id:
+            QMessageBox.warning(self, "Ошибка", "Выберите запись для изменения")
+            return
+        params = self.get_booking_params()
+        if params is None:
+            return
+        if not self.check_conflicts(params):
+            return
+        previous = self.selected_appointment
+        self.tasks.run(self.repository.save, params,
+                       on_result=lambda result: self.on_appointment_changed(previous, params, result),
+                       on_error=lambda e: self.on_write_error(e, "Ошибка изменения записи"))
+
+    def on_appointment_changed(self, previous, params, result):
+        self.apply_appointment_change(previous, params, result)
+        self.selected_appointment_id = None
+        self.selected_appointment = None
+        QMessageBox.information(self, "Успех", "Запись успешно изменена")
 
     def cancel_appointment(self):
-        try:
-            if not self.selected_appointment_id:
-                QMessageBox.warning(self, "Ошибка", "Выберите запись для отмены")
-                return
-            reply = QMessageBox.question(self, 'Подтверждение',
-                                         'Вы уверены, что хотите отменить эту запись?',
-                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
-            if reply == QMessageBox.Yes:
-                query = "DELETE FROM app_serv WHERE appoint_id = %s"
-                self.db.cursor.execute(query, (self.selected_appointment_id,))
-                query = "DELETE FROM appointment WHERE appoint_id = %s"
-                self.db.cursor.execute(query, (self.selected_appointment_id,))
-                self.db.connection.commit()
-                self.update_appointments_table()
-                self.selected_appointment_id = None
-                QMessageBox.information(self, "Успех", "Запись успешно отменена")
-        except Exception as e:
-            self.db.connection.rollback()
-            QMessageBox.critical(self, "Ошибка", f"Ошибка отмены записи: {str(e)}")
-
-    def select_appointment(self, item):
-        row = item.row()
-        self.selected_appointment_id = self.appointment_ids.get(row)
+        if not self.selected_appointment_id:
+            QMessageBox.warning(self, "Ошибка", "Выберите запись для отмены")
+            return
+        reply = QMessageBox.question(self, 'Подтверждение',
+                                     'Вы уверены, что хотите отменить эту запись?',
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            previous = self.selected_appointment
+            self.tasks.run(self.repository.delete, self.selected_appointment_id,
+                           on_result=lambda _: self.on_appointment_cancelled(previous),
+                           error_message="Ошибка отмены записи")
+
+    def on_appointment_cancelled(self, previous):
+        self.apply_appointment_change(previous)
+        self.selected_appointment_id = None
+        self.selected_appointment = None
+        QMessageBox.information(self, "Успех", "Запись успешно отменена")
+
+    def select_appointment(self, index):
+        appointment = self.appointments_model.row_data(index.row())
+        self.selected_appointment_id = appointment['appoint_id'] if appointment else None
+        self.selected_appointment = dict(appointment, date=self.selected_date) if appointment else None
         if self.selected_appointment_id is None:
             QMessageBox.warning(self, "Ошибка", "Не удалось получить ID записи")
             return
-        query = """
-            SELECT 
-                a.snils,
-                a.dent_id,
-                GROUP_CONCAT(s.name_serv) as services,
-                TIME_FORMAT(a.time_s, '%H:%i') as start_time,
-                TIME_FORMAT(a.time_e, '%H:%i') as end_time
-            FROM appointment a
-            JOIN app_serv aps ON a.appoint_id = aps.Appoint_id
-            JOIN services s ON aps.serv_id = s.serv_id
-            WHERE a.appoint_id = %s
-            GROUP BY a.appoint_id, a.snils, a.dent_id, a.time_s, a.time_e
-        """
-        try:
-            self.db.cursor.execute(query, (self.selected_appointment_id,))
-            appointment_data = self.db.cursor.fetchone()
-            if appointment_data:
-                for i in range(self.patient_combo.count()):
-                    patient_text = self.patient_combo.itemText(i)
-                    if str(appointment_data['snils']) in patient_text:
-                        self.patient_combo.setCurrentIndex(i)
-                        break
-                for doctor_name, doctor_id in self.doctor_data.items():
-                    if doctor_id == appointment_data['dent_id']:
-                        self.doctor_combo.setCurrentText(doctor_name)
-                        break
-                services = appointment_data['services'].split(',')
-                for checkbox in self.services_checkboxes:
-                    checkbox.setChecked(checkbox.text().strip() in services)
-                self.start_time.setTime(QTime.fromString(appointment_data['start_time'], "HH:mm"))
-                self.end_time.setTime(QTime.fromString(appointment_data['end_time'], "HH:mm"))
-            else:
-                QMessageBox.warning(self, "Ошибка", "Не удалось найти запись для данного ID.")
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка при извлечении данных о записи: {str(e)}")
+        self.tasks.run(self.repository.details, self.selected_appointment_id, on_result=self.set_selected_appointment,
+                       on_error=self.on_selected_appointment_error, busy=False)
+
+    def on_selected_appointment_error(self, error):
+        if isinstance(error, NotFoundError):
+            QMessageBox.warning(self, "Ошибка", str(error))
+        else:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка при извлечении данных о записи: {str(error)}")
+
+    def set_selected_appointment(self, appointment_data):
+        if appointment_data['appoint_id'] != self.selected_appointment_id:
+            return
+        self.set_patient({
+            'snils_id': appointment_data['snils'],
+            'surname_p': appointment_data['surname_p'],
+            'name_p': appointment_data['name_p'],
+            'patron_p': appointment_data['patron_p']
+        })
+        index = self.doctor_indexes.get(appointment_data['dent_id'])
+        if index is not None:
+            self.doctor_combo.setCurrentIndex(index)
+        self.services_model.set_checked(appointment_data['service_ids'])
+        self.start_time.setTime(QTime.fromString(appointment_data['start_time'], "HH:mm"))
+        self.end_time.setTime(QTime.fromString(appointment_data['end_time'], "HH:mm"))
 
 
 class PatientDialog(QDialog):
     def __init__(self, patient_data=None, parent=None):
         super().__init__(parent)
-        self.db = DatabaseConnection()
         self.setWindowTitle("Пациент")
         self.setModal(True)
         layout = QGridLayout()
@@ -1109,15 +1239,33 @@ class PatientDialog(QDialog):
 class PatientManagementTab(QWidget):
     def __init__(self):
         super().__init__()
-        self.db = DatabaseConnection()
+        self.repository = PatientRepository()
+        self.loaded = False
         self.initUI()
-        self.load_patients()
+        self.tasks = TaskRunner(self, [self.patient_table])
+        self.patient_search = DebouncedSearch(self.tasks, self.repository.search, self.show_patient_matches,
+                                              PATIENT_SEARCH_DELAY, limit=PATIENT_PAGE_SIZE,
+                                              error_message="Ошибка поиска пациентов")
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.loaded:
+            self.loaded = True
+            self.load_patients()
 
     def initUI(self):
         layout = QVBoxLayout()
-        self.patient_table = QTableWidget(0, 7)
-        self.patient_table.setHorizontalHeaderLabels(['СНИЛС', 'Фамилия', 'Имя', 'Отчество', 'Дата рождения', 'Телефон',
-                                                      'Пол'])
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Поиск: фамилия, СНИЛС или телефон")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.textChanged.connect(lambda text: self.patient_search.schedule(text))
+        change_feed.changed.connect(self.on_data_changed)
+        self.patient_model = PagedTableModel([('СНИЛС', 'snils_id'), ('Фамилия', 'surname_p'), ('Имя', 'name_p'),
+                                              ('Отчество', 'patron_p'), ('Дата рождения', 'birthday'),
+                                              ('Телефон', 'phone'), ('Пол', 'gender')],
+                                             self.load_patients_page, PATIENT_PAGE_SIZE, self)
+        self.patient_table = QTableView()
+        self.patient_table.setModel(self.patient_model)
         self.patient_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.patient_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.patient_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
@@ -1128,6 +1276,7 @@ class PatientManagementTab(QWidget):
         remove_patient_button = QPushButton('Удалить')
         remove_patient_button.clicked.connect(self.remove_patient)
         layout.addWidget(QLabel('Список пациентов'))
+        layout.addWidget(self.search_input)
         layout.addWidget(self.patient_table)
         buttons_layout = QHBoxLayout()
         buttons_layout.addWidget(add_patient_button)
@@ -1137,104 +1286,65 @@ class PatientManagementTab(QWidget):
         self.setLayout(layout)
 
     def load_patients(self):
-        try:
-            self.db.cursor.execute("""
-                SELECT snils_id, surname_p, name_p, patron_p, 
-                       DATE_FORMAT(birthday, '%d.%m.%Y') as birthday, 
-                       phone, gender 
-                FROM patients
-            """)
-            patients = self.db.cursor.fetchall()
-            self.patient_table.setRowCount(0)
-            for patient in patients:
-                row = self.patient_table.rowCount()
-                self.patient_table.insertRow(row)
-                self.patient_table.setItem(row, 0, QTableWidgetItem(patient['snils_id']))
-                self.patient_table.setItem(row, 1, QTableWidgetItem(patient['surname_p']))
-                self.patient_table.setItem(row, 2, QTableWidgetItem(patient['name_p']))
-                self.patient_table.setItem(row, 3, QTableWidgetItem(patient['patron_p']))
-                self.patient_table.setItem(row, 4, QTableWidgetItem(patient['birthday']))
-                self.patient_table.setItem(row, 5, QTableWidgetItem(patient['phone']))
-                self.patient_table.setItem(row, 6, QTableWidgetItem(patient['gender']))
-        except Exception as e:
-            QMessageBox.critical(self, 'Ошибка', f'Ошибка при загрузке данных: {str(e)}')
+        if self.patient_search.text:
+            self.patient_search.run()
+        else:
+            self.patient_model.reload()
+
+    def on_data_changed(self, change_set):
+        if change_set.local or 'patients' not in change_set.entities:
+            return
+        if self.isVisible():
+            self.load_patients()
+        else:
+            self.loaded = False
+
+    def show_patient_matches(self, text, patients):
+        if text:
+            self.patient_model.set_rows(patients)
+        else:
+            self.patient_model.reload()
+
+    def load_patients_page(self, generation, last_patient, page_size):
+        self.tasks.run(self.repository.page, last_patient, page_size,
+                       on_result=lambda rows: self.patient_model.append_rows(generation, rows),
+                       on_error=lambda e: self.on_patients_page_error(generation, e),
+                       busy=last_patient is None)
+
+    def on_patients_changed(self, _=None):
+        self.load_patients()
+
+    def on_patients_page_error(self, generation, error):
+        self.patient_model.fetch_failed(generation)
+        QMessageBox.critical(self, 'Ошибка', f'Ошибка при загрузке данных: {str(error)}')
 
     def add_patient(self):
         dialog = PatientDialog(parent=self)
         if dialog.exec_() == QDialog.Accepted:
-            patient_data = dialog.get_patient_data()
-            try:
-                self.db.cursor.execute("""
-                    INSERT INTO patients (snils_id, surname_p, name_p, patron_p, birthday, phone, gender)
-                    VALUES (%s, %s, %s, %s, STR_TO_DATE(%s, '%d.%m.%Y'), %s, %s)
-                """, (
-                    patient_data['snils_id'],
-                    patient_data['surname_p'],
-                    patient_data['name_p'],
-                    patient_data['patron_p'],
-                    patient_data['birthday'],
-                    patient_data['phone'],
-                    patient_data['gender']
-                ))
-                self.db.connection.commit()
-                self.load_patients()
-            except Exception as e:
-                self.db.connection.rollback()
-                QMessageBox.critical(self, 'Ошибка', f'Ошибка при добавлении пациента: {str(e)}')
+            self.tasks.run(self.repository.create, dialog.get_patient_data(), on_result=self.on_patients_changed,
+                           error_message='Ошибка при добавлении пациента')
 
     def edit_patient(self):
-        current_row = self.patient_table.currentRow()
+        current_row = self.patient_table.currentIndex().row()
         if current_row >= 0:
-            patient_data = {
-                'snils_id': self.patient_table.item(current_row, 0).text(),
-                'surname_p': self.patient_table.item(current_row, 1).text(),
-                'name_p': self.patient_table.item(current_row, 2).text(),
-                'patron_p': self.patient_table.item(current_row, 3).text(),
-                'birthday': self.patient_table.item(current_row, 4).text(),
-                'phone': self.patient_table.item(current_row, 5).text(),
-                'gender': 'М'
-            }
+            patient_data = dict(self.patient_model.row_data(current_row))
             dialog = PatientDialog(patient_data, parent=self)
             if dialog.exec_() == QDialog.Accepted:
-                new_patient_data = dialog.get_patient_data()
-                try:
-                    self.db.cursor.execute("""
-                        UPDATE patients 
-                        SET surname_p = %s, name_p = %s, patron_p = %s, birthday = STR_TO_DATE(%s, '%d.%m.%Y'),
-                            phone = %s, gender = %s
-                        WHERE snils_id = %s
-                    """, (
-                        new_patient_data['surname_p'],
-                        new_patient_data['name_p'],
-                        new_patient_data['patron_p'],
-                        new_patient_data['birthday'],
-                        new_patient_data['phone'],
-                        new_patient_data['gender'],
-                        new_patient_data['snils_id']
-                    ))
-                    self.db.connection.commit()
-                    self.load_patients()
-                except Exception as e:
-                    self.db.connection.rollback()
-                    QMessageBox.critical(self, 'Ошибка', f'Ошибка при обновлении данных пациента: {str(e)}')
+                self.tasks.run(self.repository.update, dialog.get_patient_data(), on_result=self.on_patients_changed,
+                               error_message='Ошибка при обновлении данных пациента')
         else:
             QMessageBox.warning(self, 'Предупреждение', 'Пожалуйста, выберите пациента для редактирования.')
 
     def remove_patient(self):
-        current_row = self.patient_table.currentRow()
+        current_row = self.patient_table.currentIndex().row()
         if current_row >= 0:
-            snils = self.patient_table.item(current_row, 0).text()
+            snils = self.patient_model.row_data(current_row)['snils_id']
             reply = QMessageBox.question(self, 'Подтверждение',
                                          f'Вы хотите удалить пациента с СНИЛС {snils}?',
                                          QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
             if reply == QMessageBox.Yes:
-                try:
-                    self.db.cursor.execute("DELETE FROM Patients WHERE snils_id = %s", (snils,))
-                    self.db.connection.commit()
-                    self.load_patients()
-                except Exception as e:
-                    self.db.connection.rollback()
-                    QMessageBox.critical(self, 'Ошибка', f'Ошибка при удалении пациента: {str(e)}')
+                self.tasks.run(self.repository.delete, snils, on_result=self.on_patients_changed,
+                               error_message='Ошибка при удалении пациента')
         else:
             QMessageBox.warning(self, 'Предупреждение', 'Пожалуйста, выберите пациента для удаления.')
 
@@ -1242,8 +1352,12 @@ class PatientManagementTab(QWidget):
 class ReportingTab(QWidget):
     def __init__(self):
         super().__init__()
-        self.db = DatabaseConnection()
+        self.repository = ReportRepository()
+        self.report_period = None
+        self.export_control = None
+        self.export_progress = None
         self.initUI()
+        self.tasks = TaskRunner(self, [self.generate_report_btn, self.save_report_btn, self.report_text])
 
     def initUI(self):
         layout = QVBoxLayout()
@@ -1263,15 +1377,20 @@ class ReportingTab(QWidget):
         dash_label.setStyleSheet(""" QLabel {font-size: 16px; font-weight: bold; margin: 0 6px;} """)
         period_layout.addWidget(dash_label)
         period_layout.addWidget(self.end_date_edit)
+        period_layout.addWidget(QLabel('Отчет:'))
+        self.report_type_combo = QComboBox()
+        for report_type, title in REPORT_TYPES.items():
+            self.report_type_combo.addItem(title, report_type)
+        period_layout.addWidget(self.report_type_combo)
         period_layout.addStretch()
         period_group.setLayout(period_layout)
         button_layout = QHBoxLayout()
-        generate_report_btn = QPushButton('Сформировать отчет')
-        generate_report_btn.clicked.connect(self.generate_report)
-        save_report_btn = QPushButton('Сохранить отчет')
-        save_report_btn.clicked.connect(self.save_report)
-        button_layout.addWidget(generate_report_btn)
-        button_layout.addWidget(save_report_btn)
+        self.generate_report_btn = QPushButton('Сформировать отчет')
+        self.generate_report_btn.clicked.connect(self.generate_report)
+        self.save_report_btn = QPushButton('Сохранить отчет')
+        self.save_report_btn.clicked.connect(self.save_report)
+        button_layout.addWidget(self.generate_report_btn)
+        button_layout.addWidget(self.save_report_btn)
         self.report_text = QTextEdit()
         self.report_text.setReadOnly(True)
         layout.addWidget(period_group)
@@ -1281,78 +1400,279 @@ class ReportingTab(QWidget):
         self.setLayout(layout)
 
     def generate_report(self):
-        try:
-            start_date = self.start_date_edit.date().toString(Qt.ISODate)
-            end_date = self.end_date_edit.date().toString(Qt.ISODate)
-            query = """
-            SELECT s.name_serv AS service_name, COUNT(*) AS service_count, s.price AS unit_price, SUM(s.price) AS total_revenue
-            FROM services s
-            JOIN app_serv aps ON s.serv_id = aps.serv_id
-            JOIN appointment a ON aps.appoint_id = a.appoint_id
-            WHERE a.date BETWEEN %s AND %s
-            GROUP BY s.name_serv, s.price
-            ORDER BY total_revenue DESC
-            """
-            self.db.cursor.execute(query, (start_date, end_date))
-            services_stats = self.db.cursor.fetchall()
-            report = f"ОТЧЕТ О ДОХОДАХ СТОМАТОЛОГИЧЕСКОЙ КЛИНИКИ\nПериод: {start_date} - {end_date}\n"
-            for service in services_stats:
-                report += f"\nУслуга: {service['service_name']}\n"
-                report += f"Количество оказаний: {service['service_count']}\n"
-                report += f"Цена: {service['unit_price']:,} руб.\n"
-                report += f"Общая выручка: {service['total_revenue']:,} руб.\n"
-            total_income = sum(service['total_revenue'] for service in services_stats)
-            report += f"\nОбщий доход за период: {total_income:,} руб."
-            self.report_text.setPlainText(report)
-        except Exception as e:
-            self.show_error_message(f"Ошибка при формировании отчета: {str(e)}")
+        start_date = self.start_date_edit.date().toString(Qt.ISODate)
+        end_date = self.end_date_edit.date().toString(Qt.ISODate)
+        report_type = self.report_type_combo.currentData()
+        self.tasks.run(self.build_report, report_type, start_date, end_date,
+                       on_result=lambda report: self.set_report(report, start_date, end_date),
+                       on_error=lambda e: self.show_error_message(f"Ошибка при формировании отчета: {str(e)}"))
+
+    def set_report(self, report, start_date, end_date):
+        self.report_period = (start_date, end_date)
+        self.report_text.setPlainText(report)
+
+    def build_report(self, report_type, start_date, end_date):
+        report = (f"ОТЧЕТ О ДОХОДАХ СТОМАТОЛОГИЧЕСКОЙ КЛИНИКИ\n{REPORT_TYPES[report_type]}\n"
+                  f"Период: {start_date} - {end_date}\n")
+        if report_type == 'services':
+            return report + self.format_service_revenue(self.repository.service_revenue(start_date, end_date))
+        period = analytics.load_period(start_date, end_date)
+        if report_type == 'weekday_hour':
+            return report + self.format_weekday_hour(*analytics.revenue_by_weekday_hour(period))
+        if report_type == 'average_ticket':
+            return report + self.format_average_ticket(analytics.average_ticket(period))
+        if report_type == 'patient_mix':
+            return report + self.format_patient_mix(analytics.patient_mix(period))
+        doctors, specialties = reference_cache.get_many(['doctors', 'specialties'])
+        if report_type == 'doctors':
+            names = {doctor['dent_id']: doctor_name(doctor) for doctor in doctors}
+            rows = analytics.revenue_by_doctor(period)
+        elif report_type == 'specialties':
+            names = {specialty['id_special']: specialty['name_sp'] for specialty in specialties}
+            names[0] = 'Без специализации'
+            rows = analytics.revenue_by_specialty(period)
+        else:
+            names = {}
+            rows = [(f"Кабинет {cabinet}", count, revenue)
+                    for cabinet, count, revenue in analytics.revenue_by_cabinet(period)]
+        return report + self.format_grouped_revenue(rows, names)
+
+    def format_service_revenue(self, services_stats):
+        report = ''
+        for service in services_stats:
+            report += f"\nУслуга: {service['service_name']}\n"
+            report += f"Количество оказаний: {service['service_count']}\n"
+            report += f"Средняя цена: {service['unit_price']:,} руб.\n"
+            report += f"Общая выручка: {service['total_revenue']:,} руб.\n"
+        total_income = sum(service['total_revenue'] for service in services_stats)
+        report += f"\nОбщий доход за период: {total_income:,} руб."
+        return report
+
+    def format_grouped_revenue(self, rows, names):
+        report = ''
+        for key, count, revenue in rows:
+            report += f"\n{names.get(key, key)}\n"
+            report += f"Количество приемов: {count}\n"
+            report += f"Выручка: {revenue:,.0f} руб.\n"
+        report += f"\nОбщий доход за период: {sum(row[2] for row in rows):,.0f} руб."
+        return report
+
+    def format_weekday_hour(self, counts, totals):
+        report = ''
+        for weekday, title in enumerate(WEEKDAYS):
+            if not counts[weekday].any():
+                continue
+            report += f"\n{title}: {int(counts[weekday].sum())} приемов, {totals[weekday].sum():,.0f} руб.\n"
+            for hour in counts[weekday].nonzero()[0]:
+                report += (f"  {hour:02d}:00 - {int(counts[weekday][hour])} приемов, "
+                           f"{totals[weekday][hour]:,.0f} руб.\n")
+        report += f"\nОбщий доход за период: {totals.sum():,.0f} руб."
+        return report
+
+    def format_average_ticket(self, ticket):
+        return (f"\nКоличество приемов: {ticket['count']}\n"
+                f"Общая выручка: {ticket['total']:,.0f} руб.\n"
+                f"Средний чек: {ticket['mean']:,.2f} руб.\n"
+                f"Медианный чек: {ticket['median']:,.2f} руб.")
+
+    def format_patient_mix(self, mix):
+        report = ''
+        for name, title in (('new', 'Новые пациенты'), ('returning', 'Повторные пациенты')):
+            report += f"\n{title}: {mix[name]['patients']}\n"
+            report += f"Приемов: {mix[name]['visits']}\n"
+            report += f"Выручка: {mix[name]['revenue']:,.0f} руб.\n"
+        return report
 
     def save_report(self):
-        try:
-            if not self.report_text.toPlainText():
-                self.show_error_message("Сначала сформируйте отчет!")
-                return
-            file_name, _ = QFileDialog.getSaveFileName(
-                self, "Сохранить отчет", os.path.join(os.path.expanduser("~"), "Отчет о доходах.pdf"), "PDF Files (*.pdf)"
-            )
-            if file_name:
-                from reportlab.lib.pagesizes import A4
-                from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-                from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-                from reportlab.pdfbase import pdfmetrics
-                from reportlab.pdfbase.ttfonts import TTFont
-
-                try:
-                    pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
-                except:
-                    pass
-
-                doc = SimpleDocTemplate(file_name, pagesize=A4)
-                styles = getSampleStyleSheet()
-                styles.add(ParagraphStyle(
-                    name='CustomStyle',
-                    fontName='Arial' if 'Arial' in pdfmetrics.getRegisteredFontNames() else 'Helvetica',
-                    fontSize=10,
-                    leading=12,
-                ))
-                elements = []
-                text = self.report_text.toPlainText()
-                for line in text.split('\n'):
-                    if line.strip():
-                        elements.append(Paragraph(line, styles['CustomStyle']))
-                        elements.append(Spacer(1, 6))
-                doc.build(elements)
-        except Exception as e:
-            self.show_error_message(f"Ошибка при сохранении отчета: {str(e)}")
+        if not self.report_period or not self.report_text.toPlainText():
+            self.show_error_message("Сначала сформируйте отчет!")
+            return
+        file_name, selected_filter = QFileDialog.getSaveFileName(
+            self, "Сохранить отчет", os.path.join(os.path.expanduser("~"), "Отчет о доходах.pdf"),
+            ';;'.join(EXPORT_FORMATS.values())
+        )
+        if not file_name:
+            return
+        export_format = os.path.splitext(file_name)[1].lower().lstrip('.')
+        if export_format not in EXPORT_FORMATS:
+            export_format = next((key for key, title in EXPORT_FORMATS.items() if title == selected_filter), 'pdf')
+            file_name += '.' + export_format
+        title_lines = self.report_text.toPlainText().split('\n')
+        self.export_progress = QProgressDialog("Экспорт отчета...", "Отмена", 0, 100, self)
+        self.export_progress.setWindowTitle("Сохранение отчета")
+        self.export_progress.setWindowModality(Qt.WindowModal)
+        self.export_progress.setAutoClose(False)
+        self.export_progress.setAutoReset(False)
+        self.export_progress.setMinimumDuration(0)
+        self.export_control = self.tasks.run_controlled(
+            export_report, file_name, export_format, title_lines, *self.report_period,
+            on_progress=self.on_export_progress,
+            on_result=lambda count: self.on_export_finished(file_name, count),
+            on_error=self.on_export_error
+        )
+        self.export_progress.canceled.connect(self.export_control.cancel)
+
+    def on_export_progress(self, progress):
+        done, total = progress
+        if self.export_progress is not None:
+            self.export_progress.setLabelText(f"Экспорт отчета: {done:,} из {total:,} записей")
+            self.export_progress.setValue(done * 100 // total if total else 100)
+
+    def close_export_progress(self):
+        if self.export_progress is not None:
+            self.export_progress.close()
+        self.export_progress = None
+        self.export_control = None
+
+    def on_export_finished(self, file_name, count):
+        self.close_export_progress()
+        QMessageBox.information(self, "Успех", f"Отчет сохранен: {file_name}\nЗаписей о приемах: {count:,}")
+
+    def on_export_error(self, error):
+        self.close_export_progress()
+        if isinstance(error, TaskCancelled):
+            QMessageBox.information(self, "Сохранение отчета", "Экспорт отчета отменен")
+            return
+        self.show_error_message(f"Ошибка при сохранении отчета: {str(error)}")
 
     def show_error_message(self, message):
         QMessageBox.warning(self, "Ошибка", message)
 
 
+class DiagnosticsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Диагностика запросов")
+        self.resize(1000, 600)
+        layout = QVBoxLayout()
+        self.summary_label = QLabel()
+        self.summary_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.queries_model = RecordTableModel([('Источник', 'caller'), ('Запрос', 'query'),
+                                               ('Вызовов', 'count', Qt.AlignCenter),
+                                               ('Среднее, мс', 'avg_ms', Qt.AlignCenter),
+                                               ('Макс., мс', 'max_ms', Qt.AlignCenter),
+                                               ('Строк', 'rows', Qt.AlignCenter),
+                                               ('Медленных', 'slow', Qt.AlignCenter),
+                                               ('Ошибок', 'errors', Qt.AlignCenter)], self)
+        self.queries_table = QTableView()
+        self.queries_table.setModel(self.queries_model)
+        self.queries_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.queries_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.queries_table.setWordWrap(False)
+        self.queries_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.slow_list = QListWidget()
+        layout.addWidget(self.summary_label)
+        layout.addWidget(QLabel(f"Запросы (медленные — от {query_stats.slow_query_ms:.0f} мс):"))
+        layout.addWidget(self.queries_table, 3)
+        layout.addWidget(QLabel("Последние медленные запросы:"))
+        layout.addWidget(self.slow_list, 1)
+        btn_layout = QHBoxLayout()
+        refresh_btn = QPushButton('Обновить')
+        refresh_btn.clicked.connect(self.refresh)
+        reset_btn = QPushButton('Сбросить')
+        reset_btn.clicked.connect(self.reset)
+        export_btn = QPushButton('Экспорт метрик')
+        export_btn.clicked.connect(self.export_metrics)
+        close_btn = QPushButton('Закрыть')
+        close_btn.clicked.connect(self.close)
+        for btn in (refresh_btn, reset_btn, export_btn, close_btn):
+            btn_layout.addWidget(btn)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start(DIAGNOSTICS_REFRESH_MS)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        pool = get_pool().stats()
+        transactions = transaction_stats.snapshot()
+        self.summary_label.setText(
+            f"Пул соединений: {pool['in_use']} из {pool['size']} занято, {pool['idle']} свободно, "
+            f"выдач {pool['checkouts']}, ожиданий {pool['waits']}, таймаутов {pool['timeouts']}, "
+            f"переподключений {pool['reconnects']}\n"
+            f"Транзакции: {transactions['commits']} из {transactions['attempts']} попыток, "
+            f"повторов {transactions['retries']}, взаимоблокировок {transactions['deadlocks']}, "
+            f"таймаутов блокировок {transactions['lock_timeouts']}, ожиданий блокировок "
+            f"{transactions['lock_waits']} ({transactions['lock_wait_time'] * 1000:.0f} мс)"
+        )
+        entries = sorted(query_stats.snapshot(), key=lambda entry: entry['total_time'], reverse=True)
+        self.queries_model.set_rows([dict(entry, avg_ms=f"{entry['total_time'] * 1000 / entry['count']:.2f}",
+                                          max_ms=f"{entry['max_time'] * 1000:.2f}") for entry in entries])
+        self.slow_list.clear()
+        for record in reversed(query_stats.slow_queries()):
+            self.slow_list.addItem(f"{record['time']}  {record['elapsed'] * 1000:.1f} мс  строк {record['rows']}  "
+                                   f"{record['caller']}  {record['params']}  {record['query']}")
+
+    def reset(self):
+        query_stats.reset()
+        self.refresh()
+
+    def export_metrics(self):
+        file_name, _ = QFileDialog.getSaveFileName(self, "Экспорт метрик",
+                                                   os.path.join(os.path.expanduser("~"), "stomat.prom"),
+                                                   "Prometheus (*.prom);;Text (*.txt)")
+        if not file_name:
+            return
+        try:
+            write_metrics(file_name)
+        except OSError as e:
+            QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить метрики: {str(e)}")
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
+        self.tabs = {}
+        self.started = False
         self.initUI()
+        self.tasks = TaskRunner(self)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.started:
+            self.started = True
+            QTimer.singleShot(0, self.on_first_show)
+
+    def on_first_show(self):
+        self.build_tab(self.tab_widget.currentIndex())
+        change_feed.failed.connect(self.on_change_feed_failed)
+        change_feed.recovered.connect(self.statusBar().clearMessage)
+        change_feed.start()
+        try:
+            start_exporters()
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, 'Метрики', f'Не удалось запустить экспорт метрик: {str(e)}')
+        self.tasks.run(verify_schema, on_result=self.on_schema_verified,
+                       error_message='Ошибка проверки схемы базы данных', busy=False)
+
+    def on_change_feed_failed(self, error):
+        self.statusBar().showMessage(f'Обновление данных с других рабочих мест не работает: {error}')
+        QMessageBox.warning(self, 'Обновление данных',
+                            f'Не удалось получить изменения с других рабочих мест: {error}\n'
+                            'Данные на экране могут быть устаревшими до восстановления соединения.')
+
+    def on_schema_verified(self, problems):
+        if not problems:
+            return
+        reply = QMessageBox.question(self, 'Схема базы данных',
+                                     'Схема базы данных устарела:\n' + '\n'.join(problems) +
+                                     '\n\nПрименить миграции?',
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        if reply == QMessageBox.Yes:
+            self.tasks.run(migrate, on_result=self.on_schema_migrated, error_message='Ошибка применения миграций')
+
+    def on_schema_migrated(self, applied):
+        QMessageBox.information(self, 'Схема базы данных',
+                                '\n'.join(f'Применена миграция {number}: {description}'
+                                           for number, description in applied) or 'Схема уже актуальна')
 
     def initUI(self):
         self.setWindowTitle('Дентал Плюс')
@@ -1363,6 +1683,17 @@ class MainWindow(QMainWindow):
         self.setPalette(palette)
         self.main_widget = self.create_main_widget()
         self.setCentralWidget(self.main_widget)
+        service_menu = self.menuBar().addMenu('Сервис')
+        diagnostics_action = service_menu.addAction('Диагностика запросов')
+        diagnostics_action.triggered.connect(self.show_diagnostics)
+        self.diagnostics_dialog = None
+
+    def show_diagnostics(self):
+        if self.diagnostics_dialog is None:
+            self.diagnostics_dialog = DiagnosticsDialog(self)
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
+        self.diagnostics_dialog.activateWindow()
 
     def create_main_widget(self):
         main_widget = QWidget()
@@ -1383,22 +1714,43 @@ class MainWindow(QMainWindow):
         tab_palette.setColor(QPalette.Text, QColor(51, 51, 51))
         tab_widget.setPalette(tab_palette)
 
-        self.doctor_tab = DoctorManagementTab()
-        tab_widget.addTab(self.doctor_tab, 'Врачи')
-        tab_widget.addTab(ServiceManagementTab(self), 'Услуги')
-        self.appointment_tab = AppointmentTab(self.doctor_tab)
-        tab_widget.addTab(self.appointment_tab, 'Запись на прием')
-        tab_widget.addTab(PatientManagementTab(), 'Пациенты')
-        tab_widget.addTab(ReportingTab(), 'Отчетность')
+        self.tab_widget = tab_widget
+        for title in MAIN_TABS:
+            placeholder = QWidget()
+            placeholder_layout = QVBoxLayout(placeholder)
+            placeholder_layout.setContentsMargins(0, 0, 0, 0)
+            tab_widget.addTab(placeholder, title)
+        tab_widget.currentChanged.connect(self.on_tab_changed)
         main_layout.addWidget(tab_widget)
         return main_widget
 
+    def on_tab_changed(self, index):
+        if self.started:
+            self.build_tab(index)
+
+    def build_tab(self, index):
+        if index < 0 or index in self.tabs:
+            return
+        tab = list(MAIN_TABS.values())[index]()
+        self.tabs[index] = tab
+        self.tab_widget.widget(index).layout().addWidget(tab)
+
     def closeEvent(self, event):
-        if hasattr(self, 'db'):
-            self.db.connection.close()
+        change_feed.stop()
+        stop_exporters()
+        close_pool()
         super().closeEvent(event)
 
 
+MAIN_TABS = {
+    'Врачи': DoctorManagementTab,
+    'Услуги': ServiceManagementTab,
+    'Запись на прием': AppointmentTab,
+    'Пациенты': PatientManagementTab,
+    'Отчетность': ReportingTab
+}
+
+
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     main_window = MainWindow()
@@ -0,0 +1,170 @@
+import csv
+import os
+import threading
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from database import DatabaseConnection
+
+EXPORT_BATCH_SIZE = 2000
+EXPORT_FORMATS = {
+    'pdf': 'PDF (*.pdf)',
+    'csv': 'CSV (*.csv)'
+}
+EXPORT_COLUMNS = ['Дата', 'Начало', 'Окончание', 'Врач', 'Пациент', 'СНИЛС', 'Кабинет', 'Услуги', 'Сумма']
+COUNT_QUERY = "SELECT COUNT(*) AS count FROM appointment WHERE date BETWEEN %s AND %s"
+APPOINTMENTS_QUERY = """
+    SELECT DATE_FORMAT(a.date, '%d.%m.%Y'),
+           TIME_FORMAT(a.time_s, '%H:%i'),
+           TIME_FORMAT(a.time_e, '%H:%i'),
+           CONCAT_WS(' ', d.surname_d, d.name_d, d.patron_d),
+           CONCAT_WS(' ', p.surname_p, p.name_p, p.patron_p),
+           a.snils,
+           a.num_cab,
+           (SELECT GROUP_CONCAT(s.name_serv ORDER BY s.name_serv SEPARATOR ', ')
+            FROM app_serv aps
+            JOIN services s ON aps.serv_id = s.serv_id
+            WHERE aps.appoint_id = a.appoint_id),
+           a.sum
+    FROM appointment a
+    JOIN dentists d ON a.dent_id = d.dent_id
+    JOIN patients p ON a.snils = p.snils_id
+    WHERE a.date BETWEEN %s AND %s
+    ORDER BY a.date, a.time_s
+"""
+PDF_FONT_SIZE = 9
+PDF_LEADING = 12
+PDF_MARGIN = 40
+PDF_MAX_ROWS = 20000
+
+_pdf_font = None
+_pdf_font_lock = threading.Lock()
+
+
+def pdf_font():
+    global _pdf_font
+    with _pdf_font_lock:
+        if _pdf_font is None:
+            try:
+                pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
+                _pdf_font = 'Arial'
+            except Exception:
+                _pdf_font = 'Helvetica'
+        return _pdf_font
+
+
+class ExportLimitError(Exception):
+    def __init__(self, limit, total):
+        super().__init__(f"В PDF можно сохранить не более {limit:,} записей, за период найдено {total:,}. "
+                         f"Сократите период или сохраните отчет в CSV.")
+        self.limit = limit
+        self.total = total
+
+
+class CsvReportWriter:
+    max_rows = None
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.writer(self.file, delimiter=';')
+
+    def write_title(self, lines):
+        for line in lines:
+            self.writer.writerow([line])
+        self.writer.writerow([])
+        self.writer.writerow(EXPORT_COLUMNS)
+
+    def write_row(self, row):
+        self.writer.writerow(['' if value is None else value for value in row])
+
+    def close(self):
+        self.file.close()
+
+
+class PdfReportWriter:
+    max_rows = PDF_MAX_ROWS
+
+    def __init__(self, path):
+        self.font = pdf_font()
+        self.width, self.height = A4
+        self.canvas = canvas.Canvas(path, pagesize=A4, pageCompression=1)
+        self.line_width = self.width - 2 * PDF_MARGIN
+        self.new_page(first=True)
+
+    def new_page(self, first=False):
+        if not first:
+            self.canvas.showPage()
+        self.canvas.setFont(self.font, PDF_FONT_SIZE)
+        self.y = self.height - PDF_MARGIN
+
+    def write_line(self, text):
+        for part in simpleSplit(text, self.font, PDF_FONT_SIZE, self.line_width) or ['']:
+            if self.y < PDF_MARGIN:
+                self.new_page()
+            self.canvas.drawString(PDF_MARGIN, self.y, part)
+            self.y -= PDF_LEADING
+
+    def write_title(self, lines):
+        for line in lines:
+            self.write_line(line)
+        self.write_line('')
+        self.write_line(' | '.join(EXPORT_COLUMNS))
+
+    def write_row(self, row):
+        date, start, end, doctor, patient, snils, cabinet, services, total = row
+        self.write_line(f"{date} {start}-{end} | {doctor} | {patient} ({snils}) | каб. {cabinet} | "
+                        f"{services or '—'} | {total:,} руб.")
+
+    def close(self):
+        self.canvas.save()
+
+
+EXPORT_WRITERS = {
+    'pdf': PdfReportWriter,
+    'csv': CsvReportWriter
+}
+
+
+def stream_appointments(control, start_date, end_date, db=None, batch_size=EXPORT_BATCH_SIZE, max_rows=None):
+    db = db or DatabaseConnection()
+    total = db.fetchone(COUNT_QUERY, (start_date, end_date))['count']
+    if max_rows is not None and total > max_rows:
+        raise ExportLimitError(max_rows, total)
+    done = 0
+    control.report((done, total))
+    with db.streaming_cursor() as cursor:
+        cursor.execute(APPOINTMENTS_QUERY, (start_date, end_date))
+        while True:
+            control.check()
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if max_rows is not None and done + len(rows) > max_rows:
+                raise ExportLimitError(max_rows, done + len(rows))
+            for row in rows:
+                yield row
+            done += len(rows)
+            control.report((done, max(total, done)))
+
+
+def export_report(control, path, export_format, title_lines, start_date, end_date, db=None):
+    writer = EXPORT_WRITERS[export_format](path)
+    count = 0
+    try:
+        writer.write_title(title_lines)
+        for row in stream_appointments(control, start_date, end_date, db, max_rows=writer.max_rows):
+            writer.write_row(row)
+            count += 1
+        writer.close()
+    except BaseException:
+        try:
+            writer.close()
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    return count
@@ -0,0 +1,143 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from database import get_pool, query_stats, transaction_stats
+
+METRICS_PORT = os.environ.get('STOMAT_METRICS_PORT')
+METRICS_FILE = os.environ.get('STOMAT_METRICS_FILE')
+METRICS_INTERVAL = float(os.environ.get('STOMAT_METRICS_INTERVAL', 15))
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_exporters = []
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def metric(lines, name, kind, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{escape_label(label)}"' for key, label in labels)
+        lines.append(f"{name}{{{label_text}}} {format_value(value)}" if label_text else
+                     f"{name} {format_value(value)}")
+
+
+def histogram(lines, name, help_text, callers, buckets):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for caller, stats in callers:
+        label = f'caller="{escape_label(caller)}"'
+        cumulative = 0
+        for bound, count in zip(buckets, stats['buckets']):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{label},le="+Inf"}} {stats["count"]}')
+        lines.append(f"{name}_sum{{{label}}} {format_value(stats['total_time'])}")
+        lines.append(f"{name}_count{{{label}}} {stats['count']}")
+
+
+def aggregate_by_caller(entries, buckets):
+    callers = {}
+    for entry in entries:
+        caller = callers.setdefault(entry['caller'], {'count': 0, 'errors': 0, 'rows': 0, 'slow': 0,
+                                                      'total_time': 0.0, 'buckets': [0] * len(buckets)})
+        for key in ('count', 'errors', 'rows', 'slow', 'total_time'):
+            caller[key] += entry[key]
+        caller['buckets'] = [total + count for total, count in zip(caller['buckets'], entry['buckets'])]
+    return sorted(callers.items())
+
+
+def render_metrics():
+    lines = []
+    buckets = query_stats.buckets
+    callers = aggregate_by_caller(query_stats.snapshot(), buckets)
+    metric(lines, 'stomat_queries_total', 'counter', 'Executed queries',
+           [((('caller', caller),), stats['count']) for caller, stats in callers])
+    metric(lines, 'stomat_query_errors_total', 'counter', 'Failed queries',
+           [((('caller', caller),), stats['errors']) for caller, stats in callers])
+    metric(lines, 'stomat_query_rows_total', 'counter', 'Rows returned or affected',
+           [((('caller', caller),), stats['rows']) for caller, stats in callers])
+    metric(lines, 'stomat_slow_queries_total', 'counter', 'Queries slower than the slow query threshold',
+           [((('caller', caller),), stats['slow']) for caller, stats in callers])
+    histogram(lines, 'stomat_query_duration_seconds', 'Query latency including fetch', callers, buckets)
+    for name, value in sorted(get_pool().stats().items()):
+        metric(lines, f'stomat_pool_{name}', 'gauge', f'Connection pool {name}', [((), value)])
+    for name, value in sorted(transaction_stats.snapshot().items()):
+        metric(lines, f'stomat_transaction_{name}_total', 'counter', f'Transactions {name}', [((), value)])
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(path):
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as output:
+        output.write(render_metrics())
+    os.replace(temporary, path)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class MetricsFileWriter(threading.Thread):
+    def __init__(self, path, interval=METRICS_INTERVAL):
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                write_metrics(self.path)
+            except OSError:
+                pass
+
+    def stop(self):
+        self.stopped.set()
+        try:
+            write_metrics(self.path)
+        except OSError:
+            pass
+
+
+def start_exporters(port=METRICS_PORT, path=METRICS_FILE):
+    if port:
+        server = MetricsServer(('127.0.0.1', int(port)), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        _exporters.append(server)
+    if path:
+        writer = MetricsFileWriter(path)
+        writer.start()
+        _exporters.append(writer)
+
+
+def stop_exporters():
+    while _exporters:
+        _exporters.pop().stop()
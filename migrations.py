@@ -0,0 +1,286 @@
+import argparse
+import sys
+
+from database import DB_CONFIG, DatabaseConnection, configure_pool
+from repository import ReportRepository, rebuild_daily_revenue
+
+SCHEMA_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS special (
+        id_special INT NOT NULL AUTO_INCREMENT,
+        name_sp VARCHAR(100) NOT NULL,
+        PRIMARY KEY (id_special)
+    ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dentists (
+        dent_id INT NOT NULL AUTO_INCREMENT,
+        surname_d VARCHAR(50) NOT NULL,
+        name_d VARCHAR(50) NOT NULL,
+        patron_d VARCHAR(50) NOT NULL,
+        special INT NULL,
+        exper INT NOT NULL,
+        num_cab INT NOT NULL,
+        PRIMARY KEY (dent_id),
+        INDEX fk_dentists_special1_idx (special),
+        CONSTRAINT fk_dentists_special1 FOREIGN KEY (special) REFERENCES special (id_special)
+            ON DELETE SET NULL ON UPDATE CASCADE
+    ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS services (
+        serv_id INT NOT NULL AUTO_INCREMENT,
+        name_serv VARCHAR(100) NOT NULL,
+        price INT NOT NULL,
+        exec_time INT NOT NULL,
+        PRIMARY KEY (serv_id)
+    ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS service_doctors (
+        id INT NOT NULL AUTO_INCREMENT,
+        dent_id INT NOT NULL,
+        serv_id INT NOT NULL,
+        PRIMARY KEY (id),
+        INDEX fk_service_doctors_dentists1_idx (dent_id),
+        CONSTRAINT fk_service_doctors_services1 FOREIGN KEY (serv_id) REFERENCES services (serv_id)
+            ON DELETE CASCADE ON UPDATE CASCADE,
+        CONSTRAINT fk_service_doctors_dentists1 FOREIGN KEY (dent_id) REFERENCES dentists (dent_id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS patients (
+        snils_id VARCHAR(14) NOT NULL,
+        surname_p VARCHAR(50) NOT NULL,
+        name_p VARCHAR(50) NOT NULL,
+        patron_p VARCHAR(50) NOT NULL,
+        birthday DATE NOT NULL,
+        phone VARCHAR(18) NOT NULL,
+        gender ENUM('М', 'Ж') NOT NULL DEFAULT 'М',
+        PRIMARY KEY (snils_id)
+    ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS appointment (
+        appoint_id INT NOT NULL AUTO_INCREMENT,
+        snils VARCHAR(14) NOT NULL,
+        dent_id INT NOT NULL,
+        time_s TIME NOT NULL,
+        time_e TIME NOT NULL,
+        num_cab INT NOT NULL,
+        date DATE NOT NULL,
+        sum INT NOT NULL,
+        PRIMARY KEY (appoint_id),
+        CONSTRAINT fk_appointment_patients FOREIGN KEY (snils) REFERENCES patients (snils_id)
+            ON DELETE CASCADE ON UPDATE CASCADE,
+        CONSTRAINT fk_appointment_dentists1 FOREIGN KEY (dent_id) REFERENCES dentists (dent_id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS app_serv (
+        id_app_serv INT NOT NULL AUTO_INCREMENT,
+        appoint_id INT NOT NULL,
+        serv_id INT NOT NULL,
+        PRIMARY KEY (id_app_serv),
+        CONSTRAINT fk_app_serv_appointment1 FOREIGN KEY (appoint_id) REFERENCES appointment (appoint_id)
+            ON DELETE CASCADE ON UPDATE CASCADE,
+        CONSTRAINT fk_app_serv_services1 FOREIGN KEY (serv_id) REFERENCES services (serv_id)
+            ON DELETE CASCADE ON UPDATE CASCADE
+    ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+    """
+]
+DAILY_REVENUE_TABLE = """
+    CREATE TABLE IF NOT EXISTS daily_service_revenue (
+        day DATE NOT NULL,
+        serv_id INT NOT NULL,
+        cnt INT NOT NULL DEFAULT 0,
+        revenue BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, serv_id)
+    ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+"""
+CHANGE_LOG_TABLE = """
+    CREATE TABLE IF NOT EXISTS change_log (
+        change_id BIGINT NOT NULL AUTO_INCREMENT,
+        entity VARCHAR(32) NOT NULL,
+        entity_id VARCHAR(32) NULL,
+        day DATE NULL,
+        dent_id INT NULL,
+        origin CHAR(32) NOT NULL,
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (change_id),
+        INDEX idx_change_log_created (created_at)
+    ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+"""
+APP_SERV_PRICE_COLUMN = ('app_serv', 'price', 'INT NOT NULL DEFAULT 0')
+APP_SERV_PRICE_STATEMENTS = [
+    "UPDATE app_serv aps JOIN services s ON aps.Serv_id = s.serv_id SET aps.price = s.price",
+    """
+    UPDATE app_serv aps
+    JOIN (SELECT Appoint_id, SUM(price) AS total FROM app_serv GROUP BY Appoint_id) t
+        ON aps.Appoint_id = t.Appoint_id
+    JOIN appointment a ON aps.Appoint_id = a.appoint_id
+    SET aps.price = ROUND(aps.price * a.sum / t.total)
+    WHERE t.total > 0 AND t.total <> a.sum
+    """,
+    """
+    UPDATE app_serv aps
+    JOIN (SELECT Appoint_id, SUM(price) AS total, MAX(id_app_serv) AS last_id FROM app_serv GROUP BY Appoint_id) t
+        ON aps.id_app_serv = t.last_id
+    JOIN appointment a ON aps.Appoint_id = a.appoint_id
+    SET aps.price = aps.price + a.sum - t.total
+    WHERE t.total <> a.sum
+    """
+]
+ACCESS_PATH_INDEXES = [
+    ('appointment', 'idx_appointment_day', ('date', 'time_s')),
+    ('appointment', 'idx_appointment_doctor_day', ('dent_id', 'date', 'time_s', 'time_e')),
+    ('appointment', 'idx_appointment_cabinet_day', ('num_cab', 'date', 'time_s', 'time_e')),
+    ('appointment', 'idx_appointment_patient_day', ('snils', 'date', 'time_s', 'time_e')),
+    ('app_serv', 'idx_app_serv_appointment', ('appoint_id', 'serv_id')),
+    ('app_serv', 'idx_app_serv_service', ('serv_id', 'appoint_id')),
+    ('service_doctors', 'idx_service_doctors_service', ('serv_id', 'dent_id')),
+    ('patients', 'idx_patients_name', ('surname_p', 'name_p', 'snils_id'))
+]
+SEARCH_INDEXES = [
+    ('patients', 'idx_patients_phone', ('phone',))
+]
+
+
+def index_exists(cursor, table, name):
+    cursor.execute("""
+        SELECT COUNT(*) AS count
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, name))
+    return cursor.fetchone()['count'] > 0
+
+
+def column_exists(cursor, table, name):
+    cursor.execute("""
+        SELECT COUNT(*) AS count
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, name))
+    return cursor.fetchone()['count'] > 0
+
+
+def add_column(cursor, table, name, definition):
+    if not column_exists(cursor, table, name):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+def create_indexes(indexes):
+    def apply(cursor):
+        for table, name, columns in indexes:
+            if not index_exists(cursor, table, name):
+                cursor.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+    return apply
+
+
+def run_statements(statements):
+    def apply(cursor):
+        for statement in statements:
+            cursor.execute(statement)
+    return apply
+
+
+def store_service_prices(cursor):
+    add_column(cursor, *APP_SERV_PRICE_COLUMN)
+    run_statements(APP_SERV_PRICE_STATEMENTS)(cursor)
+    rebuild_daily_revenue(cursor)
+
+
+MIGRATIONS = [
+    (1, 'Базовая схема', run_statements(SCHEMA_TABLES)),
+    (2, 'Индексы для расписания, записей, услуг и списка пациентов', create_indexes(ACCESS_PATH_INDEXES)),
+    (3, 'Дневная выручка по услугам', run_statements([DAILY_REVENUE_TABLE])),
+    (4, 'Индекс для поиска пациентов по телефону', create_indexes(SEARCH_INDEXES)),
+    (5, 'Журнал изменений для обновления рабочих мест', run_statements([CHANGE_LOG_TABLE])),
+    (6, 'Цена услуги в записи на момент оформления', store_service_prices)
+]
+
+
+def ensure_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT NOT NULL,
+            description VARCHAR(200) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (version)
+        ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+    """)
+
+
+def current_version(cursor):
+    cursor.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version")
+    return cursor.fetchone()['version']
+
+
+def migrate(db=None, target=None):
+    db = db or DatabaseConnection()
+    applied = []
+    with db.cursor() as cursor:
+        ensure_version_table(cursor)
+        version = current_version(cursor)
+        for number, description, apply in MIGRATIONS:
+            if number <= version or (target is not None and number > target):
+                continue
+            apply(cursor)
+            cursor.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                           (number, description))
+            applied.append((number, description))
+    return applied
+
+
+def verify_schema(db=None):
+    db = db or DatabaseConnection()
+    problems = []
+    with db.cursor() as cursor:
+        ensure_version_table(cursor)
+        version = current_version(cursor)
+        latest = MIGRATIONS[-1][0]
+        if version < latest:
+            problems.append(f"Версия схемы {version}, требуется {latest}")
+        for table, name, _ in ACCESS_PATH_INDEXES + SEARCH_INDEXES:
+            if not index_exists(cursor, table, name):
+                problems.append(f"Нет индекса {name} в таблице {table}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Миграции схемы базы данных')
+    parser.add_argument('--database', default=DB_CONFIG['database'])
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = commands.add_parser('migrate', help='применить недостающие миграции')
+    migrate_parser.add_argument('--target', type=int)
+    commands.add_parser('verify', help='проверить версию схемы и индексы')
+    rebuild_parser = commands.add_parser('rebuild-revenue', help='пересчитать дневную выручку по услугам')
+    rebuild_parser.add_argument('--start', help='первый день периода, ГГГГ-ММ-ДД')
+    rebuild_parser.add_argument('--end', help='последний день периода, ГГГГ-ММ-ДД')
+    args = parser.parse_args()
+    db = DatabaseConnection(configure_pool(database=args.database))
+    if args.command == 'migrate':
+        applied = migrate(db, args.target)
+        for number, description in applied:
+            print(f"Применена миграция {number}: {description}")
+        if not applied:
+            print("Схема уже актуальна")
+        return
+    if args.command == 'rebuild-revenue':
+        if (args.start is None) != (args.end is None):
+            parser.error('--start и --end задаются вместе')
+        ReportRepository(db).rebuild_revenue(args.start, args.end)
+        print("Дневная выручка пересчитана")
+        return
+    problems = verify_schema(db)
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+    print("Схема и индексы в порядке")
+
+
+if __name__ == '__main__':
+    main()
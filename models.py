@@ -0,0 +1,283 @@
+from PyQt5.QtCore import QAbstractItemModel, QAbstractTableModel, QModelIndex, Qt, pyqtSignal
+
+
+class RecordTableModel(QAbstractTableModel):
+    def __init__(self, columns, parent=None):
+        super().__init__(parent)
+        self.columns = [column if len(column) == 3 else (*column, None) for column in columns]
+        self.rows = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        _, key, alignment = self.columns[index.column()]
+        if role == Qt.DisplayRole:
+            value = row.get(key)
+            return '' if value is None else str(value)
+        if role == Qt.TextAlignmentRole and alignment is not None:
+            return int(alignment)
+        if role == Qt.UserRole:
+            return row
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section][0]
+        return super().headerData(section, orientation, role)
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = list(rows)
+        self.endResetModel()
+
+    def row_data(self, row):
+        if 0 <= row < len(self.rows):
+            return self.rows[row]
+        return None
+
+    def find_row(self, key, value):
+        for row, record in enumerate(self.rows):
+            if record.get(key) == value:
+                return row
+        return -1
+
+    def insert_record(self, record, sort_key=None):
+        position = len(self.rows)
+        if sort_key is not None:
+            position = next((row for row, existing in enumerate(self.rows)
+                             if existing.get(sort_key) > record.get(sort_key)), len(self.rows))
+        self.beginInsertRows(QModelIndex(), position, position)
+        self.rows.insert(position, record)
+        self.endInsertRows()
+        return position
+
+    def remove_record(self, key, value):
+        row = self.find_row(key, value)
+        if row >= 0:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.rows[row]
+            self.endRemoveRows()
+        return row
+
+
+class PagedTableModel(RecordTableModel):
+    def __init__(self, columns, fetch_page, page_size=200, parent=None):
+        super().__init__(columns, parent)
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.generation = 0
+        self._loading = False
+        self._exhausted = False
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._loading and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._loading = True
+        self.fetch_page(self.generation, self.rows[-1] if self.rows else None, self.page_size)
+
+    def append_rows(self, generation, rows):
+        if generation != self.generation:
+            return
+        self._loading = False
+        self._exhausted = len(rows) < self.page_size
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+
+    def set_rows(self, rows):
+        self.generation += 1
+        self._loading = False
+        self._exhausted = True
+        super().set_rows(rows)
+
+    def fetch_failed(self, generation):
+        if generation == self.generation:
+            self._loading = False
+            self._exhausted = True
+
+    def reload(self):
+        self.beginResetModel()
+        self.generation += 1
+        self.rows = []
+        self._loading = False
+        self._exhausted = False
+        self.endResetModel()
+        self.fetchMore()
+
+
+class CheckableTreeModel(QAbstractItemModel):
+    checked_changed = pyqtSignal()
+
+    def __init__(self, columns, key, parent=None):
+        super().__init__(parent)
+        self.columns = [column if len(column) == 3 else (*column, None) for column in columns]
+        self.key = key
+        self.groups = []
+        self.group_ids = {}
+        self.next_group_id = 1
+        self.records = {}
+        self.checked = set()
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if parent.isValid():
+            return self.createIndex(row, column, self.groups[parent.row()]['id'])
+        return self.createIndex(row, column, 0)
+
+    def parent(self, index):
+        if not index.isValid() or index.internalId() == 0:
+            return QModelIndex()
+        return self.createIndex(self.groups.index(self.group_ids[index.internalId()]), 0, 0)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self.groups)
+        if parent.internalId() == 0 and parent.column() == 0:
+            return len(self.groups[parent.row()]['ids'])
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section][0]
+        return super().headerData(section, orientation, role)
+
+    def record(self, index):
+        if not index.isValid() or index.internalId() == 0:
+            return None
+        return self.records[self.group_ids[index.internalId()]['ids'][index.row()]]
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        if index.internalId() == 0:
+            return Qt.ItemIsEnabled
+        if index.column() == 0:
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if index.internalId() == 0:
+            group = self.groups[index.row()]
+            if role == Qt.DisplayRole and index.column() == 0:
+                selected = sum(1 for key in group['ids'] if key in self.checked)
+                return f"{group['name']} ({selected}/{len(group['ids'])})" if selected else group['name']
+            return None
+        record = self.record(index)
+        _, key, alignment = self.columns[index.column()]
+        if role == Qt.DisplayRole:
+            value = record.get(key)
+            return '' if value is None else str(value)
+        if role == Qt.CheckStateRole and index.column() == 0:
+            return Qt.Checked if record[self.key] in self.checked else Qt.Unchecked
+        if role == Qt.TextAlignmentRole and alignment is not None:
+            return int(alignment)
+        if role == Qt.UserRole:
+            return record
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        record = self.record(index)
+        if record is None or role != Qt.CheckStateRole:
+            return False
+        if value == Qt.Checked:
+            self.checked.add(record[self.key])
+        else:
+            self.checked.discard(record[self.key])
+        self.emit_checked({record[self.key]})
+        return True
+
+    def checked_keys(self):
+        return [key for key in self.records if key in self.checked]
+
+    def set_checked(self, keys):
+        keys = {key for key in keys if key in self.records}
+        changed = keys ^ self.checked
+        self.checked = keys
+        if changed:
+            self.emit_checked(changed)
+
+    def emit_checked(self, keys):
+        last = len(self.columns) - 1
+        for group_row, group in enumerate(self.groups):
+            rows = [group['rows'][key] for key in keys if key in group['rows']]
+            if rows:
+                parent = self.index(group_row, 0)
+                self.dataChanged.emit(self.index(min(rows), 0, parent), self.index(max(rows), last, parent))
+                self.dataChanged.emit(parent, parent)
+        self.checked_changed.emit()
+
+    def set_groups(self, groups):
+        self.records = {record[self.key]: record for _, records in groups for record in records}
+        names = [name for name, _ in groups]
+        for group_row in reversed(range(len(self.groups))):
+            if self.groups[group_row]['name'] not in names:
+                self.beginRemoveRows(QModelIndex(), group_row, group_row)
+                del self.group_ids[self.groups.pop(group_row)['id']]
+                self.endRemoveRows()
+        for group_row, (name, records) in enumerate(groups):
+            current = [group['name'] for group in self.groups]
+            if name in current[group_row + 1:]:
+                source_row = current.index(name, group_row + 1)
+                self.beginMoveRows(QModelIndex(), source_row, source_row, QModelIndex(), group_row)
+                self.groups.insert(group_row, self.groups.pop(source_row))
+                self.endMoveRows()
+            elif group_row >= len(self.groups) or self.groups[group_row]['name'] != name:
+                group = {'id': self.next_group_id, 'name': name, 'ids': [], 'rows': {}}
+                self.next_group_id += 1
+                self.beginInsertRows(QModelIndex(), group_row, group_row)
+                self.groups.insert(group_row, group)
+                self.group_ids[group['id']] = group
+                self.endInsertRows()
+            self.sync_group(group_row, [record[self.key] for record in records])
+        if len(self.groups) > len(groups):
+            self.beginRemoveRows(QModelIndex(), len(groups), len(self.groups) - 1)
+            for group in self.groups[len(groups):]:
+                del self.group_ids[group['id']]
+            del self.groups[len(groups):]
+            self.endRemoveRows()
+        checked = self.checked & set(self.records)
+        if checked != self.checked:
+            self.checked = checked
+            self.checked_changed.emit()
+
+    def sync_group(self, group_row, keys):
+        group = self.groups[group_row]
+        parent = self.index(group_row, 0)
+        wanted = set(keys)
+        for row in reversed(range(len(group['ids']))):
+            if group['ids'][row] not in wanted:
+                self.beginRemoveRows(parent, row, row)
+                del group['ids'][row]
+                self.endRemoveRows()
+        for row, key in enumerate(keys):
+            if row < len(group['ids']) and group['ids'][row] == key:
+                continue
+            if key in group['ids']:
+                self.beginRemoveRows(parent, group['ids'].index(key), group['ids'].index(key))
+                group['ids'].remove(key)
+                self.endRemoveRows()
+            self.beginInsertRows(parent, row, row)
+            group['ids'].insert(row, key)
+            self.endInsertRows()
+        group['rows'] = {key: row for row, key in enumerate(group['ids'])}
+        if group['ids']:
+            self.dataChanged.emit(self.index(0, 0, parent), self.index(len(group['ids']) - 1, len(self.columns) - 1,
+                                                                      parent))
+        self.dataChanged.emit(parent, parent)
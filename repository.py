@@ -0,0 +1,483 @@
+from datetime import date as Date
+
+import mysql.connector
+
+from cache import reference_cache
+from changes import record_changes
+from database import DatabaseConnection, insert_rows, sync_links
+from schedule import date_range, lock_resources, qualified_doctors, required_duration, schedule_index
+
+
+REVENUE_REBUILD_QUERY = """
+    INSERT INTO daily_service_revenue (day, serv_id, cnt, revenue)
+    SELECT a.date, aps.Serv_id, COUNT(*), SUM(aps.price)
+    FROM appointment a
+    JOIN app_serv aps ON a.appoint_id = aps.Appoint_id
+    {where}
+    GROUP BY a.date, aps.Serv_id
+"""
+PATIENT_COLUMNS = """
+    snils_id, surname_p, name_p, patron_p, DATE_FORMAT(birthday, '%d.%m.%Y') as birthday, phone, gender
+"""
+SNILS_MASK = '999-999-999 99'
+PHONE_MASK = '+7 (999) 999-99-99'
+
+
+def like_prefix(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def mask_prefix(digits, mask):
+    prefix = ''
+    for char in mask:
+        if not digits:
+            return prefix
+        if char == '9':
+            prefix, digits = prefix + digits[0], digits[1:]
+        else:
+            prefix += char
+    return None if digits else prefix
+
+
+def rebuild_daily_revenue(cursor, start_date=None, end_date=None):
+    if start_date is None:
+        cursor.execute("DELETE FROM daily_service_revenue")
+        cursor.execute(REVENUE_REBUILD_QUERY.format(where=''))
+    else:
+        cursor.execute("DELETE FROM daily_service_revenue WHERE day BETWEEN %s AND %s", (start_date, end_date))
+        cursor.execute(REVENUE_REBUILD_QUERY.format(where='WHERE a.date BETWEEN %s AND %s'), (start_date, end_date))
+
+
+def add_daily_revenue(cursor, deltas):
+    rows = [(day, serv_id, cnt, revenue) for (day, serv_id), (cnt, revenue) in sorted(deltas.items())
+            if cnt or revenue]
+    if not rows:
+        return
+    query = f"""
+        INSERT INTO daily_service_revenue (day, serv_id, cnt, revenue)
+        VALUES {', '.join(['(%s, %s, %s, %s)'] * len(rows))}
+        ON DUPLICATE KEY UPDATE cnt = cnt + VALUES(cnt), revenue = revenue + VALUES(revenue)
+    """
+    cursor.execute(query, [value for row in rows for value in row])
+
+
+def booked_services(cursor, condition, params):
+    cursor.execute(f"""
+        SELECT a.appoint_id, a.date, a.dent_id, aps.Serv_id AS serv_id, aps.price
+        FROM appointment a
+        JOIN app_serv aps ON a.appoint_id = aps.Appoint_id
+        WHERE {condition}
+    """, params)
+    return cursor.fetchall()
+
+
+def revenue_deltas(rows, sign, deltas=None):
+    deltas = {} if deltas is None else deltas
+    for row in rows:
+        key = (str(row['date']), row['serv_id'])
+        cnt, revenue = deltas.get(key, (0, 0))
+        deltas[key] = (cnt + sign, revenue + sign * row['price'])
+    return deltas
+
+
+class RepositoryError(Exception):
+    pass
+
+
+class NotFoundError(RepositoryError):
+    pass
+
+
+class ConstraintError(RepositoryError):
+    pass
+
+
+class ValidationError(RepositoryError):
+    pass
+
+
+class ConflictError(RepositoryError):
+    def __init__(self, conflicts):
+        super().__init__('Время уже занято')
+        self.conflicts = conflicts
+
+
+class Repository:
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+
+    def _write(self, fn, *args):
+        try:
+            with self.db.transaction() as cursor:
+                return fn(cursor, *args)
+        except mysql.connector.IntegrityError as e:
+            raise ConstraintError(str(e)) from e
+
+    def _execute(self, query, params=None, required=False, entity=None, entity_id=None):
+        def execute(cursor):
+            cursor.execute(query, params)
+            if required and cursor.rowcount == 0:
+                raise NotFoundError('Запись не найдена')
+            lastrowid = cursor.lastrowid
+            if entity:
+                record_changes(cursor, entity, entity_id or lastrowid)
+            return lastrowid
+        return self._write(execute)
+
+
+class DoctorRepository(Repository):
+    def create(self, data):
+        dent_id = self._execute("""
+            INSERT INTO dentists (surname_d, name_d, patron_d, special, exper, num_cab)
+            VALUES (%(surname_d)s, %(name_d)s, %(patron_d)s, %(special)s, %(exper)s, %(num_cab)s)
+        """, data, entity='doctors')
+        reference_cache.invalidate('doctors')
+        return dent_id
+
+    def update(self, dent_id, data):
+        self._execute("""
+            UPDATE dentists
+            SET surname_d=%(surname_d)s, name_d=%(name_d)s, patron_d=%(patron_d)s,
+                special=%(special)s, exper=%(exper)s, num_cab=%(num_cab)s
+            WHERE dent_id=%(dent_id)s
+        """, dict(data, dent_id=dent_id), entity='doctors', entity_id=dent_id)
+        reference_cache.invalidate('doctors')
+
+    def delete(self, dent_id):
+        self._write(self._delete, dent_id)
+        reference_cache.invalidate('doctors', 'service_doctors')
+
+    def _delete(self, cursor, dent_id):
+        booked = booked_services(cursor, "a.dent_id = %s", (dent_id,))
+        cursor.execute("DELETE FROM dentists WHERE dent_id = %s", (dent_id,))
+        if cursor.rowcount == 0:
+            raise NotFoundError('Запись не найдена')
+        add_daily_revenue(cursor, revenue_deltas(booked, -1))
+        record_changes(cursor, 'doctors', dent_id)
+        record_changes(cursor, 'schedule')
+
+
+class ServiceRepository(Repository):
+    def save(self, data, serv_id=None):
+        serv_id = self._write(self._save, data, serv_id)
+        reference_cache.invalidate('services', 'service_doctors')
+        return serv_id
+
+    def _save(self, cursor, data, serv_id):
+        if serv_id:
+            cursor.execute("""
+                UPDATE services SET name_serv = %s, price = %s, exec_time = %s WHERE serv_id = %s
+            """, (data['name_serv'], data['price'], data['exec_time'], serv_id))
+            sync_links(cursor, 'service_doctors', 'serv_id', serv_id, 'dent_id', data['doctors'])
+        else:
+            cursor.execute("INSERT INTO services (name_serv, price, exec_time) VALUES (%s, %s, %s)",
+                           (data['name_serv'], data['price'], data['exec_time']))
+            serv_id = cursor.lastrowid
+            insert_rows(cursor, 'service_doctors', ('serv_id', 'dent_id'),
+                        [(serv_id, dent_id) for dent_id in set(data['doctors'])])
+        record_changes(cursor, 'services', serv_id)
+        return serv_id
+
+    def delete(self, serv_id):
+        self._write(self._delete, serv_id)
+        reference_cache.invalidate('services', 'service_doctors')
+
+    def _delete(self, cursor, serv_id):
+        cursor.execute("DELETE FROM service_doctors WHERE serv_id = %s", (serv_id,))
+        cursor.execute("DELETE FROM services WHERE serv_id = %s", (serv_id,))
+        if cursor.rowcount == 0:
+            raise NotFoundError('Услуга не найдена')
+        cursor.execute("DELETE FROM daily_service_revenue WHERE serv_id = %s", (serv_id,))
+        record_changes(cursor, 'services', serv_id)
+        record_changes(cursor, 'schedule')
+
+
+class PatientRepository(Repository):
+    def page(self, last_patient=None, page_size=200):
+        query = f"SELECT {PATIENT_COLUMNS} FROM patients"
+        if last_patient is None:
+            params = (page_size,)
+        else:
+            query += """
+            WHERE surname_p > %s
+               OR (surname_p = %s AND (name_p > %s OR (name_p = %s AND snils_id > %s)))
+            """
+            params = (last_patient['surname_p'], last_patient['surname_p'], last_patient['name_p'],
+                      last_patient['name_p'], last_patient['snils_id'], page_size)
+        query += " ORDER BY surname_p, name_p, snils_id LIMIT %s"
+        return self.db.fetchall(query, params)
+
+    def search(self, text, limit=20):
+        text = ' '.join(text.split())
+        if not text:
+            return []
+        branches = []
+        params = []
+        digits = ''.join(char for char in text if char.isdigit())
+        if digits and not any(char.isalpha() for char in text):
+            snils = mask_prefix(digits, SNILS_MASK)
+            if snils:
+                branches.append(('snils_id LIKE %s', 'snils_id'))
+                params += [like_prefix(snils), limit]
+            phone_digits = {digits[1:]} if text.startswith('+7') else {digits}
+            if digits[0] in '78' and len(digits) > 1:
+                phone_digits.add(digits[1:])
+            for local_digits in sorted(phone_digits):
+                phone = mask_prefix(local_digits, PHONE_MASK)
+                if phone and local_digits:
+                    branches.append(('phone LIKE %s', 'phone'))
+                    params += [like_prefix(phone), limit]
+        else:
+            words = text.split(' ')
+            if len(words) > 1:
+                branches.append(('surname_p = %s AND name_p LIKE %s', 'surname_p, name_p, snils_id'))
+                params += [words[0], like_prefix(words[1]), limit]
+            else:
+                branches.append(('surname_p LIKE %s', 'surname_p, name_p, snils_id'))
+                params += [like_prefix(text), limit]
+        if not branches:
+            return []
+        query = ' UNION '.join(f"(SELECT {PATIENT_COLUMNS} FROM patients WHERE {condition} ORDER BY {order} LIMIT %s)"
+                               for condition, order in branches)
+        query += " ORDER BY surname_p, name_p, snils_id LIMIT %s"
+        return self.db.fetchall(query, params + [limit])
+
+    def create(self, data):
+        self._execute("""
+            INSERT INTO patients (snils_id, surname_p, name_p, patron_p, birthday, phone, gender)
+            VALUES (%(snils_id)s, %(surname_p)s, %(name_p)s, %(patron_p)s,
+                    STR_TO_DATE(%(birthday)s, '%d.%m.%Y'), %(phone)s, %(gender)s)
+        """, data, entity='patients', entity_id=data['snils_id'])
+
+    def update(self, data):
+        self._write(self._update, data)
+
+    def _update(self, cursor, data):
+        cursor.execute("""
+            UPDATE patients
+            SET surname_p = %(surname_p)s, name_p = %(name_p)s, patron_p = %(patron_p)s,
+                birthday = STR_TO_DATE(%(birthday)s, '%d.%m.%Y'), phone = %(phone)s, gender = %(gender)s
+            WHERE snils_id = %(snils_id)s
+        """, data)
+        cursor.execute("SELECT DISTINCT dent_id, date FROM appointment WHERE snils = %s", (data['snils_id'],))
+        record_changes(cursor, 'patients', data['snils_id'],
+                       {(row['dent_id'], row['date']) for row in cursor.fetchall()})
+
+    def delete(self, snils):
+        booked = self._write(self._delete, snils)
+        for appointment_id in {row['appoint_id'] for row in booked}:
+            schedule_index.remove(appointment_id)
+
+    def _delete(self, cursor, snils):
+        booked = booked_services(cursor, "a.snils = %s", (snils,))
+        cursor.execute("DELETE FROM patients WHERE snils_id = %s", (snils,))
+        if cursor.rowcount == 0:
+            raise NotFoundError('Запись не найдена')
+        add_daily_revenue(cursor, revenue_deltas(booked, -1))
+        record_changes(cursor, 'patients', snils, {(row['dent_id'], row['date']) for row in booked})
+        return booked
+
+
+class AppointmentRepository(Repository):
+    def for_day(self, date):
+        query = """
+               SELECT
+                   CONCAT(p.surname_p, ' ', p.name_p, ' ', p.patron_p) as patient_name,
+                   CONCAT(d.surname_d, ' ', d.name_d, ' ', d.patron_d) as doctor_name,
+                   d.num_cab as cabinet,
+                   GROUP_CONCAT(s.name_serv SEPARATOR ', ') as services,
+                   TIME_FORMAT(a.time_s, '%H:%i') as start_time,
+                   TIME_FORMAT(a.time_e, '%H:%i') as end_time,
+                   a.sum as total_sum,
+                   a.appoint_id,
+                   a.dent_id,
+                   a.num_cab,
+                   a.snils,
+                   a.time_s,
+                   a.time_e
+               FROM appointment a
+               JOIN patients p ON a.snils = p.snils_id
+               JOIN dentists d ON a.dent_id = d.dent_id
+               JOIN app_serv aps ON a.appoint_id = aps.Appoint_id
+               JOIN services s ON aps.Serv_id = s.serv_id
+               WHERE a.date = %s
+               GROUP BY a.appoint_id, p.surname_p, p.name_p, p.patron_p,
+                        d.surname_d, d.name_d, d.patron_d, d.num_cab, a.time_s, a.time_e, a.sum,
+                        a.num_cab, a.snils
+               ORDER BY a.time_s
+           """
+        appointments = self.db.fetchall(query, (date,))
+        schedule_index.load_day(date, appointments)
+        return appointments
+
+    def doctor_schedule(self, doctor_id, month_start, month_end):
+        query = """
+            SELECT
+                a.appoint_id,
+                a.date,
+                TIME_FORMAT(a.time_s, '%H:%i') as start_time,
+                TIME_FORMAT(a.time_e, '%H:%i') as end_time,
+                CONCAT(p.surname_p, ' ', p.name_p) as patient_name,
+                GROUP_CONCAT(s.name_serv SEPARATOR ', ') as services
+            FROM appointment a
+            JOIN patients p ON a.snils = p.snils_id
+            JOIN app_serv aps ON a.appoint_id = aps.Appoint_id
+            JOIN services s ON aps.Serv_id = s.serv_id
+            WHERE a.dent_id = %s AND a.date >= %s AND a.date < %s
+            GROUP BY a.appoint_id, a.date, a.time_s, a.time_e, p.surname_p, p.name_p
+            ORDER BY a.date, a.time_s
+        """
+        appointments_by_date = {}
+        for appointment in self.db.fetchall(query, (doctor_id, month_start, month_end)):
+            appointments_by_date.setdefault(appointment['date'].strftime('%Y-%m-%d'), []).append({
+                'id': appointment['appoint_id'],
+                'time': f"{appointment['start_time']} - {appointment['end_time']}",
+                'patient': appointment['patient_name'],
+                'services': appointment['services']
+            })
+        return appointments_by_date
+
+    def details(self, appointment_id):
+        query = """
+            SELECT
+                a.appoint_id,
+                a.snils,
+                p.surname_p,
+                p.name_p,
+                p.patron_p,
+                a.dent_id,
+                TIME_FORMAT(a.time_s, '%H:%i') as start_time,
+                TIME_FORMAT(a.time_e, '%H:%i') as end_time,
+                GROUP_CONCAT(aps.Serv_id ORDER BY aps.Serv_id) as service_ids
+            FROM appointment a
+            JOIN patients p ON a.snils = p.snils_id
+            LEFT JOIN app_serv aps ON a.appoint_id = aps.Appoint_id
+            WHERE a.appoint_id = %s
+            GROUP BY a.appoint_id, a.snils, p.surname_p, p.name_p, p.patron_p, a.dent_id, a.time_s, a.time_e
+        """
+        appointment = self.db.fetchone(query, (appointment_id,))
+        if not appointment:
+            raise NotFoundError('Не удалось найти запись для данного ID.')
+        service_ids = appointment['service_ids']
+        appointment['service_ids'] = [int(serv_id) for serv_id in service_ids.split(',')] if service_ids else []
+        return appointment
+
+    def conflicts(self, booking):
+        return self.validate([booking])[0]
+
+    def validate(self, bookings):
+        if any(booking['time_s'] >= booking['time_e'] for booking in bookings):
+            raise ValidationError('Время окончания должно быть позже времени начала')
+        return schedule_index.validate(bookings)
+
+    def find_slots(self, service_ids, snils, start_date, days, limit, exclude=None):
+        services, service_doctors, doctors = reference_cache.get_many(['services', 'service_doctors', 'doctors'])
+        duration = required_duration(services, service_ids)
+        if duration <= 0:
+            raise ValidationError('Для выбранных услуг не задано время выполнения')
+        qualified = qualified_doctors(service_doctors, service_ids)
+        candidates = [(doctor['dent_id'], doctor['num_cab']) for doctor in doctors if doctor['dent_id'] in qualified]
+        dates = date_range(max(start_date, Date.today().isoformat()), days)
+        schedule_index.load_range(dates)
+        return duration, schedule_index.find_slots(dates, candidates, duration, snils, limit, exclude=exclude)
+
+    def save(self, booking):
+        try:
+            result = self.db.run_transaction(self._save, booking)
+        except mysql.connector.IntegrityError as e:
+            raise ConstraintError(str(e)) from e
+        schedule_index.add(result['appoint_id'], booking)
+        return result
+
+    def _save(self, cursor, booking):
+        conflicts = lock_resources(self.db, cursor, booking).validate([booking])[0]
+        if conflicts:
+            raise ConflictError(conflicts)
+        booked = []
+        if booking['appoint_id']:
+            booked = booked_services(cursor, "a.appoint_id = %s", (booking['appoint_id'],))
+        affected = {(row['dent_id'], row['date']) for row in booked} | {(booking['dent_id'], booking['date'])}
+        prices = self._service_prices(cursor, booking['services'])
+        total_sum = sum(prices.values())
+        values = (booking['dent_id'], booking['snils'], booking['time_s'], booking['time_e'],
+                  booking['num_cab'], booking['date'], total_sum)
+        appointment_id = booking['appoint_id']
+        if appointment_id:
+            query = """
+                UPDATE appointment
+                SET dent_id = %s,
+                    snils = %s,
+                    time_s = %s,
+                    time_e = %s,
+                    num_cab = %s,
+                    date = %s,
+                    sum = %s
+                WHERE appoint_id = %s
+            """
+            cursor.execute(query, values + (appointment_id,))
+            sync_links(cursor, 'app_serv', 'Appoint_id', appointment_id, 'Serv_id', booking['services'],
+                       existing=[row['serv_id'] for row in booked])
+            cursor.execute(f"""
+                UPDATE app_serv
+                SET price = CASE Serv_id {' '.join(['WHEN %s THEN %s'] * len(prices))} END
+                WHERE Appoint_id = %s
+            """, [value for item in prices.items() for value in item] + [appointment_id])
+        else:
+            query = """
+                INSERT INTO appointment (dent_id, snils, time_s, time_e, num_cab, date, sum)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """
+            cursor.execute(query, values)
+            appointment_id = cursor.lastrowid
+            insert_rows(cursor, 'app_serv', ('Appoint_id', 'Serv_id', 'price'),
+                        [(appointment_id, serv_id, price) for serv_id, price in prices.items()])
+        deltas = revenue_deltas(booked, -1)
+        revenue_deltas([{'date': booking['date'], 'serv_id': serv_id, 'price': price}
+                        for serv_id, price in prices.items()], 1, deltas)
+        add_daily_revenue(cursor, deltas)
+        record_changes(cursor, 'appointment', appointment_id, affected)
+        return {'appoint_id': appointment_id, 'total_sum': total_sum}
+
+    def _service_prices(self, cursor, service_ids):
+        services_list = ', '.join(['%s' for _ in set(service_ids)])
+        query = f"""
+            SELECT serv_id, price
+            FROM services
+            WHERE serv_id IN ({services_list})
+        """
+        cursor.execute(query, list(set(service_ids)))
+        prices = {row['serv_id']: row['price'] for row in cursor.fetchall()}
+        if len(prices) != len(set(service_ids)) or sum(prices.values()) <= 0:
+            raise ValidationError("Ошибка расчета суммы услуг")
+        return prices
+
+    def delete(self, appointment_id):
+        self._write(self._delete, appointment_id)
+        schedule_index.remove(appointment_id)
+
+    def _delete(self, cursor, appointment_id):
+        booked = booked_services(cursor, "a.appoint_id = %s", (appointment_id,))
+        cursor.execute("DELETE FROM app_serv WHERE appoint_id = %s", (appointment_id,))
+        cursor.execute("DELETE FROM appointment WHERE appoint_id = %s", (appointment_id,))
+        if cursor.rowcount == 0:
+            raise NotFoundError('Запись не найдена')
+        add_daily_revenue(cursor, revenue_deltas(booked, -1))
+        record_changes(cursor, 'appointment', appointment_id, {(row['dent_id'], row['date']) for row in booked})
+
+
+class ReportRepository(Repository):
+    def service_revenue(self, start_date, end_date):
+        query = """
+        SELECT s.name_serv AS service_name, SUM(r.cnt) AS service_count,
+               ROUND(SUM(r.revenue) / SUM(r.cnt)) AS unit_price, SUM(r.revenue) AS total_revenue
+        FROM daily_service_revenue r
+        JOIN services s ON r.serv_id = s.serv_id
+        WHERE r.day BETWEEN %s AND %s
+        GROUP BY r.serv_id, s.name_serv
+        HAVING service_count > 0
+        ORDER BY total_revenue DESC
+        """
+        return self.db.fetchall(query, (start_date, end_date))
+
+    def rebuild_revenue(self, start_date=None, end_date=None):
+        self._write(rebuild_daily_revenue, start_date, end_date)
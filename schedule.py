@@ -0,0 +1,258 @@
+import bisect
+import itertools
+import threading
+from datetime import date as Date, datetime, timedelta
+
+from database import DatabaseConnection
+
+RESOURCE_FIELDS = {
+    'doctor': 'dent_id',
+    'cabinet': 'num_cab',
+    'patient': 'snils'
+}
+WORKDAY_START = 8 * 60
+WORKDAY_END = 20 * 60
+SLOT_STEP = 5
+RANGE_QUERY = """
+    SELECT appoint_id, date, dent_id, num_cab, snils, time_s, time_e
+    FROM appointment
+    WHERE date BETWEEN %s AND %s
+"""
+LOCK_QUERY = """
+    SELECT appoint_id, dent_id, num_cab, snils, time_s, time_e
+    FROM appointment
+    WHERE {field} = %s AND date = %s
+    FOR UPDATE
+"""
+
+
+def to_minutes(value):
+    if isinstance(value, timedelta):
+        return int(value.total_seconds()) // 60
+    hours, minutes = str(value).split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def to_time(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def date_range(start, days):
+    first = Date.fromisoformat(start)
+    return [(first + timedelta(days=offset)).isoformat() for offset in range(days)]
+
+
+def required_duration(services, service_ids):
+    exec_times = {service['serv_id']: service['exec_time'] or 0 for service in services}
+    return sum(exec_times[service_id] for service_id in service_ids)
+
+
+def qualified_doctors(service_doctors, service_ids):
+    doctors_by_service = {}
+    for row in service_doctors:
+        doctors_by_service.setdefault(row['serv_id'], set()).add(row['dent_id'])
+    qualified = None
+    for service_id in service_ids:
+        doctors = doctors_by_service.get(service_id, set())
+        qualified = doctors if qualified is None else qualified & doctors
+    return qualified or set()
+
+
+def free_windows(busy, duration, day_start=WORKDAY_START, day_end=WORKDAY_END):
+    current = day_start
+    for start, end in sorted(busy):
+        window_end = min(start, day_end)
+        if window_end - current >= duration:
+            yield current, window_end
+        current = max(current, end)
+        if current >= day_end:
+            return
+    if day_end - current >= duration:
+        yield current, day_end
+
+
+def slot_starts(busy, duration, day_start=WORKDAY_START, day_end=WORKDAY_END, step=SLOT_STEP):
+    for window_start, window_end in free_windows(busy, duration, day_start, day_end):
+        yield from range(window_start, window_end - duration + 1, step)
+
+
+class IntervalList:
+    def __init__(self):
+        self.starts = []
+        self.intervals = []
+        self.max_ends = []
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def add(self, start, end, item_id):
+        position = bisect.bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.intervals.insert(position, (start, end, item_id))
+        self.max_ends.insert(position, end)
+        self._update_max_ends(position)
+
+    def remove(self, start, item_id):
+        position = bisect.bisect_left(self.starts, start)
+        while position < len(self.starts) and self.starts[position] == start:
+            if self.intervals[position][2] == item_id:
+                del self.starts[position]
+                del self.intervals[position]
+                del self.max_ends[position]
+                self._update_max_ends(position)
+                return True
+            position += 1
+        return False
+
+    def _update_max_ends(self, position):
+        current = self.max_ends[position - 1] if position > 0 else None
+        for index in range(position, len(self.intervals)):
+            end = self.intervals[index][1]
+            current = end if current is None else max(current, end)
+            self.max_ends[index] = current
+
+    def overlapping(self, start, end, exclude=None):
+        found = []
+        index = bisect.bisect_left(self.starts, end) - 1
+        while index >= 0 and self.max_ends[index] > start:
+            interval_start, interval_end, item_id = self.intervals[index]
+            if interval_end > start and item_id != exclude:
+                found.append(item_id)
+            index -= 1
+        return found
+
+
+class ScheduleIndex:
+    def __init__(self):
+        self._days = {}
+        self._appointments = {}
+        self._lock = threading.RLock()
+
+    def has_day(self, date):
+        with self._lock:
+            return date in self._days
+
+    def load_day(self, date, rows):
+        with self._lock:
+            for appointment_id in [key for key, (day, _) in self._appointments.items() if day == date]:
+                del self._appointments[appointment_id]
+            self._days[date] = {resource: {} for resource in RESOURCE_FIELDS}
+            for row in rows:
+                self._add(row['appoint_id'], date, row)
+
+    def load_range(self, dates):
+        rows_by_date = {date: [] for date in dates}
+        for row in DatabaseConnection().fetchall(RANGE_QUERY, (dates[0], dates[-1])):
+            rows_by_date[row['date'].isoformat()].append(row)
+        for date, rows in rows_by_date.items():
+            self.load_day(date, rows)
+
+    def evict_day(self, date):
+        with self._lock:
+            self.load_day(date, [])
+            del self._days[date]
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
+            self._appointments.clear()
+
+    def add(self, appointment_id, booking):
+        with self._lock:
+            self.remove(appointment_id)
+            if booking['date'] in self._days:
+                self._add(appointment_id, booking['date'], booking)
+
+    def _add(self, appointment_id, date, booking):
+        start, end = to_minutes(booking['time_s']), to_minutes(booking['time_e'])
+        day = self._days[date]
+        for resource, field in RESOURCE_FIELDS.items():
+            day[resource].setdefault(booking[field], IntervalList()).add(start, end, appointment_id)
+        self._appointments[appointment_id] = (date, dict(booking, time_s=start, time_e=end))
+
+    def remove(self, appointment_id):
+        with self._lock:
+            if appointment_id not in self._appointments:
+                return
+            date, booking = self._appointments.pop(appointment_id)
+            day = self._days[date]
+            for resource, field in RESOURCE_FIELDS.items():
+                intervals = day[resource].get(booking[field])
+                if intervals is not None:
+                    intervals.remove(booking['time_s'], appointment_id)
+                    if not intervals:
+                        del day[resource][booking[field]]
+
+    def busy(self, date, resource, key, exclude=None):
+        with self._lock:
+            intervals = self._days.get(date, {}).get(resource, {}).get(key)
+            if not intervals:
+                return []
+            return [(start, end) for start, end, item_id in intervals.intervals if item_id != exclude]
+
+    def conflicts(self, booking, exclude=None):
+        start, end = to_minutes(booking['time_s']), to_minutes(booking['time_e'])
+        found = {}
+        with self._lock:
+            day = self._days.get(booking['date'], {})
+            for resource, field in RESOURCE_FIELDS.items():
+                intervals = day.get(resource, {}).get(booking[field])
+                overlapping = intervals.overlapping(start, end, exclude) if intervals else []
+                if overlapping:
+                    found[resource] = overlapping
+        return found
+
+    def find_slots(self, dates, doctors, duration, snils=None, limit=10,
+                   day_start=WORKDAY_START, day_end=WORKDAY_END, exclude=None, now=None):
+        now = now or datetime.now()
+        today = now.date().isoformat()
+        earliest = -(-(now.hour * 60 + now.minute + 1) // SLOT_STEP) * SLOT_STEP
+        slots = []
+        for date in dates:
+            if date < today:
+                continue
+            first_start = max(day_start, earliest) if date == today else day_start
+            day_slots = []
+            for dent_id, num_cab in doctors:
+                busy = self.busy(date, 'doctor', dent_id, exclude) + self.busy(date, 'cabinet', num_cab, exclude)
+                if snils is not None:
+                    busy += self.busy(date, 'patient', snils, exclude)
+                starts = slot_starts(busy, duration, first_start, day_end)
+                for start in itertools.islice(starts, limit - len(slots)):
+                    day_slots.append((start, dent_id, num_cab))
+            day_slots.sort()
+            for start, dent_id, num_cab in day_slots[:limit - len(slots)]:
+                slots.append({'date': date, 'dent_id': dent_id, 'num_cab': num_cab,
+                              'time_s': to_time(start), 'time_e': to_time(start + duration)})
+            if len(slots) >= limit:
+                break
+        return slots
+
+    def validate(self, bookings):
+        pending = {}
+        results = []
+        for position, booking in enumerate(bookings):
+            found = self.conflicts(booking, booking.get('appoint_id'))
+            start, end = to_minutes(booking['time_s']), to_minutes(booking['time_e'])
+            for resource, field in RESOURCE_FIELDS.items():
+                intervals = pending.setdefault((booking['date'], resource, booking[field]), IntervalList())
+                overlapping = intervals.overlapping(start, end)
+                if overlapping:
+                    found.setdefault(resource, []).extend(overlapping)
+                intervals.add(start, end, ('batch', position))
+            results.append(found)
+        return results
+
+
+def lock_resources(db, cursor, booking):
+    rows = {}
+    for field in RESOURCE_FIELDS.values():
+        query = LOCK_QUERY.format(field=field)
+        for row in db.locking_read(cursor, query, (booking[field], booking['date'])):
+            rows[row['appoint_id']] = row
+    locked = ScheduleIndex()
+    locked.load_day(booking['date'], rows.values())
+    return locked
+
+
+schedule_index = ScheduleIndex()
@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime
+
+from schedule import ScheduleIndex, free_windows, slot_starts
+
+
+class FreeWindowsTest(unittest.TestCase):
+    def test_gap_is_capped_at_day_end(self):
+        self.assertEqual(list(free_windows([(1260, 1320)], 60, 1170, 1200)), [])
+
+    def test_booking_after_day_end_leaves_tail_of_day(self):
+        self.assertEqual(list(free_windows([(1260, 1320)], 30, 1170, 1200)), [(1170, 1200)])
+
+    def test_gaps_between_bookings(self):
+        busy = [(540, 600), (480, 510)]
+        self.assertEqual(list(free_windows(busy, 30, 480, 720)), [(510, 540), (600, 720)])
+
+
+class SlotStartsTest(unittest.TestCase):
+    def test_every_step_inside_a_window(self):
+        self.assertEqual(list(slot_starts([(500, 600)], 10, 480, 620, step=5)), [480, 485, 490, 600, 605, 610])
+
+
+class FindSlotsTest(unittest.TestCase):
+    def test_empty_day_offers_several_times_per_doctor(self):
+        slots = ScheduleIndex().find_slots(['2030-01-10'], [(1, 101)], 30, limit=3,
+                                           now=datetime(2030, 1, 9, 12, 0))
+        self.assertEqual([slot['time_s'] for slot in slots], ['08:00', '08:05', '08:10'])
+
+    def test_excluded_booking_frees_its_time(self):
+        index = ScheduleIndex()
+        index.load_day('2030-01-10', [{'appoint_id': 7, 'dent_id': 1, 'num_cab': 101, 'snils': '1',
+                                       'time_s': '08:00', 'time_e': '20:00'}])
+        now = datetime(2030, 1, 9, 12, 0)
+        self.assertEqual(index.find_slots(['2030-01-10'], [(1, 101)], 30, now=now), [])
+        self.assertEqual(len(index.find_slots(['2030-01-10'], [(1, 101)], 30, limit=1, exclude=7, now=now)), 1)
+
+
+class ValidateTest(unittest.TestCase):
+    def test_batch_checks_index_and_earlier_bookings(self):
+        index = ScheduleIndex()
+        index.load_day('2030-01-10', [{'appoint_id': 7, 'dent_id': 1, 'num_cab': 101, 'snils': '1',
+                                       'time_s': '09:00', 'time_e': '10:00'}])
+        bookings = [
+            {'date': '2030-01-10', 'dent_id': 1, 'num_cab': 102, 'snils': '2', 'time_s': '09:30', 'time_e': '10:30'},
+            {'date': '2030-01-10', 'dent_id': 2, 'num_cab': 103, 'snils': '2', 'time_s': '10:00', 'time_e': '11:00'},
+            {'date': '2030-01-10', 'dent_id': 3, 'num_cab': 101, 'snils': '3', 'time_s': '09:00', 'time_e': '10:00',
+             'appoint_id': 7},
+        ]
+        self.assertEqual(index.validate(bookings), [{'doctor': [7]}, {'patient': [('batch', 0)]}, {}])
+
+
+if __name__ == '__main__':
+    unittest.main()
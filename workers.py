@@ -0,0 +1,361 @@
+import itertools
+import sys
+import threading
+import time
+
+from PyQt5.QtCore import QObject, QRunnable, QThread, QThreadPool, QTimer, Qt, pyqtSignal, pyqtSlot
+from PyQt5.QtWidgets import QMessageBox
+
+from cache import reference_cache
+from changes import (CHANGE_LOOKBACK, CHANGE_POLL_INTERVAL, CHANGE_PRUNE_INTERVAL, CLIENT_ID, ChangeSet,
+                     fetch_changes, latest_change_id, prune_changes)
+from database import POOL_SIZE, DatabaseConnection, QueryScope, query_context, query_scope
+from schedule import schedule_index
+
+_thread_pool = None
+
+
+def db_thread_pool():
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = QThreadPool()
+        _thread_pool.setMaxThreadCount(POOL_SIZE)
+    return _thread_pool
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class TaskSignals(QObject):
+    result = pyqtSignal(int, object)
+    error = pyqtSignal(int, object)
+    progress = pyqtSignal(int, object)
+
+
+class TaskControl:
+    def __init__(self, task_id, signals):
+        self.task_id = task_id
+        self.signals = signals
+        self.scope = QueryScope()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+        self.scope.cancel()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise TaskCancelled()
+
+    def report(self, value):
+        try:
+            self.signals.progress.emit(self.task_id, value)
+        except RuntimeError:
+            pass
+
+
+class DbTask(QRunnable):
+    def __init__(self, task_id, signals, fn, args, kwargs, name=None, scope=None):
+        super().__init__()
+        self.task_id = task_id
+        self.name = name
+        self.scope = scope
+        self.signals = signals
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        try:
+            with query_context(self.name), query_scope(self.scope):
+                result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self._emit(self.signals.error, TaskCancelled() if self.scope and self.scope.cancelled else e)
+        else:
+            self._emit(self.signals.result, result)
+
+    def _emit(self, signal, value):
+        try:
+            signal.emit(self.task_id, value)
+        except RuntimeError:
+            pass
+
+
+class TaskRunner(QObject):
+    _ids = itertools.count(1)
+
+    def __init__(self, widget, busy_widgets=()):
+        super().__init__(widget)
+        self.widget = widget
+        self.busy_widgets = list(busy_widgets)
+        self.signals = TaskSignals(self)
+        self.signals.result.connect(self._on_result)
+        self.signals.error.connect(self._on_error)
+        self.signals.progress.connect(self._on_progress)
+        self._pending = {}
+        self._progress = {}
+        self._busy_count = 0
+
+    def run(self, fn, *args, on_result=None, on_error=None, error_message='Ошибка', busy=True, **kwargs):
+        task_id = next(self._ids)
+        self._start(task_id, fn, args, kwargs, on_result, on_error, error_message, busy)
+        return task_id
+
+    def run_cancellable(self, fn, *args, on_result=None, on_error=None, error_message='Ошибка', busy=True,
+                        **kwargs):
+        task_id = next(self._ids)
+        control = TaskControl(task_id, self.signals)
+        self._start(task_id, fn, args, kwargs, on_result, on_error, error_message, busy, control.scope)
+        return control
+
+    def run_controlled(self, fn, *args, on_progress=None, on_result=None, on_error=None, error_message='Ошибка',
+                       busy=True, **kwargs):
+        task_id = next(self._ids)
+        control = TaskControl(task_id, self.signals)
+        self._progress[task_id] = on_progress
+        self._start(task_id, fn, (control,) + args, kwargs, on_result, on_error, error_message, busy,
+                    control.scope)
+        return control
+
+    def cancel(self, control):
+        control.cancel()
+        if control.task_id in self._pending:
+            self._finish(control.task_id)
+
+    def _start(self, task_id, fn, args, kwargs, on_result, on_error, error_message, busy, scope=None):
+        self._pending[task_id] = (on_result, on_error, error_message, busy)
+        if busy:
+            self._set_busy(True)
+        db_thread_pool().start(DbTask(task_id, self.signals, fn, args, kwargs, self._task_name(fn), scope))
+
+    def _task_name(self, fn):
+        frame = sys._getframe(3)
+        while frame is not None and frame.f_code.co_filename == __file__:
+            frame = frame.f_back
+        method = frame.f_code.co_name if frame is not None else getattr(fn, '__name__', 'task')
+        return f"{type(self.widget).__name__}.{method}"
+
+    def is_busy(self):
+        return self._busy_count > 0
+
+    def _set_busy(self, busy):
+        self._busy_count += 1 if busy else -1
+        if self._busy_count != (1 if busy else 0):
+            return
+        if busy:
+            self.widget.setCursor(Qt.BusyCursor)
+        else:
+            self.widget.unsetCursor()
+        for widget in self.busy_widgets:
+            widget.setEnabled(not busy)
+
+    def _finish(self, task_id):
+        on_result, on_error, error_message, busy = self._pending.pop(task_id)
+        self._progress.pop(task_id, None)
+        if busy:
+            self._set_busy(False)
+        return on_result, on_error, error_message
+
+    @pyqtSlot(int, object)
+    def _on_result(self, task_id, result):
+        if task_id not in self._pending:
+            return
+        on_result, _, _ = self._finish(task_id)
+        if on_result:
+            on_result(result)
+
+    @pyqtSlot(int, object)
+    def _on_progress(self, task_id, value):
+        on_progress = self._progress.get(task_id)
+        if on_progress:
+            on_progress(value)
+
+    @pyqtSlot(int, object)
+    def _on_error(self, task_id, error):
+        if task_id not in self._pending:
+            return
+        _, on_error, error_message = self._finish(task_id)
+        if on_error:
+            on_error(error)
+        elif not isinstance(error, TaskCancelled):
+            QMessageBox.critical(self.widget, 'Ошибка', f'{error_message}: {error}')
+
+
+class DebouncedSearch(QObject):
+    def __init__(self, tasks, fn, on_result, delay=250, min_length=1, **kwargs):
+        super().__init__(tasks)
+        self.tasks = tasks
+        self.fn = fn
+        self.on_result = on_result
+        self.min_length = min_length
+        self.kwargs = kwargs
+        self.text = ''
+        self.generation = 0
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.run)
+
+    def schedule(self, text):
+        self.text = ' '.join(text.split())
+        self.generation += 1
+        self.timer.start()
+
+    def run(self):
+        self.timer.stop()
+        generation = self.generation
+        text = self.text
+        if len(text) < self.min_length:
+            self.on_result(text, [])
+            return
+        self.tasks.run(self.fn, text, on_result=lambda rows: self._deliver(generation, text, rows),
+                       busy=False, **self.kwargs)
+
+    def _deliver(self, generation, text, rows):
+        if generation == self.generation:
+            self.on_result(text, rows)
+
+
+class RequestScheduler(QObject):
+    def __init__(self, tasks, callback, delay=150):
+        super().__init__(tasks)
+        self.tasks = tasks
+        self.requests = {}
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(callback)
+
+    def __contains__(self, key):
+        return key in self.requests
+
+    def schedule(self):
+        self.timer.start()
+
+    def request(self, key, fn, *args, on_result=None, on_error=None, busy=True, **kwargs):
+        if key in self.requests:
+            return
+        control = self.requests[key] = self.tasks.run_cancellable(
+            fn, *args, on_result=lambda result: self._deliver(key, control, on_result, result),
+            on_error=lambda e: self._deliver(key, control, on_error, e), busy=busy, **kwargs)
+
+    def _deliver(self, key, control, callback, value):
+        if self.requests.get(key) is control:
+            del self.requests[key]
+        if callback:
+            callback(value)
+
+    def cancel(self, key):
+        control = self.requests.pop(key, None)
+        if control is not None:
+            self.tasks.cancel(control)
+
+    def retain(self, keys):
+        for key in [key for key in self.requests if key not in keys]:
+            self.cancel(key)
+
+    def cancel_all(self):
+        self.retain(())
+
+
+class ChangeWatcher(QThread):
+    changes = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    recovered = pyqtSignal()
+
+    def __init__(self, interval=CHANGE_POLL_INTERVAL, parent=None):
+        super().__init__(parent)
+        self.interval = interval
+        self.last_id = None
+        self.seen = set()
+        self._running = True
+        self._pruned = 0
+        self._failing = False
+
+    def stop(self):
+        self._running = False
+        self.wait()
+
+    def run(self):
+        db = DatabaseConnection()
+        while self._running:
+            try:
+                with query_context('ChangeWatcher'):
+                    self.poll(db)
+            except Exception as e:
+                if not self._failing:
+                    self._failing = True
+                    self.failed.emit(str(e))
+            else:
+                if self._failing:
+                    self._failing = False
+                    self.recovered.emit()
+            for _ in range(int(self.interval * 10)):
+                if not self._running:
+                    return
+                time.sleep(0.1)
+
+    def poll(self, db):
+        initial = self.last_id is None
+        if initial:
+            self.last_id = latest_change_id(db)
+        start_id = self.last_id
+        if time.monotonic() - self._pruned > CHANGE_PRUNE_INTERVAL:
+            self._pruned = time.monotonic()
+            prune_changes(db)
+        rows = fetch_changes(db, max(self.last_id - CHANGE_LOOKBACK, 0))
+        fresh = [row for row in rows if row['change_id'] not in self.seen]
+        if rows:
+            self.last_id = max(self.last_id, rows[-1]['change_id'])
+        self.seen.update(row['change_id'] for row in fresh)
+        self.seen = {change_id for change_id in self.seen if change_id > self.last_id - CHANGE_LOOKBACK}
+        if initial:
+            fresh = [row for row in fresh if row['change_id'] > start_id]
+        local = [row for row in fresh if row['origin'] == CLIENT_ID]
+        foreign = [row for row in fresh if row['origin'] != CLIENT_ID]
+        if foreign:
+            self.changes.emit(ChangeSet(foreign))
+        if local:
+            self.changes.emit(ChangeSet(local, local=True))
+
+
+class ChangeFeed(QObject):
+    changed = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    recovered = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.watcher = None
+
+    def start(self):
+        if self.watcher is None:
+            self.watcher = ChangeWatcher()
+            self.watcher.changes.connect(self.apply)
+            self.watcher.failed.connect(self.failed)
+            self.watcher.recovered.connect(self.recovered)
+            self.watcher.start()
+
+    def stop(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    def apply(self, change_set):
+        if change_set.affects_all_days():
+            schedule_index.clear()
+        if not change_set.local:
+            references = change_set.references()
+            if references:
+                reference_cache.invalidate(*references)
+            for day in change_set.days:
+                if schedule_index.has_day(day):
+                    schedule_index.evict_day(day)
+        self.changed.emit(change_set)
+
+
+change_feed = ChangeFeed()